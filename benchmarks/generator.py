@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+def generate_plan(n_tasks, n_roles=3, fan_in=2, depth=None, seed=0):
+    """
+    Синтетический план проекта в формате data/tasks.csv.
+
+    Задачи делятся на depth слоёв равного размера. Каждая задача слоя L > 0
+    зависит от одной задачи слоя L - 1 (так длина самой длинной цепочки равна depth)
+    и ещё от 0..fan_in - 1 случайных задач предыдущих слоёв.
+
+    :param n_tasks: число задач
+    :param n_roles: число ролей
+    :param fan_in: наибольшее число предшественников задачи
+    :param depth: число слоёв (по умолчанию — примерно sqrt(n_tasks))
+    :param seed: зерно генератора
+    :return: DataFrame со столбцами task_id, role, dependencies, mean, stddev
+    """
+    rng = np.random.default_rng(seed)
+    depth = max(1, min(depth or int(np.sqrt(n_tasks)), n_tasks))
+    layer = np.minimum(np.arange(n_tasks) * depth // n_tasks, depth - 1)
+    layer_start = np.searchsorted(layer, np.arange(depth + 1))
+
+    dependencies = []
+    for j in range(n_tasks):
+        L = layer[j]
+        if L == 0 or fan_in < 1:
+            dependencies.append("")
+            continue
+        # одна задача из предыдущего слоя задаёт глубину, остальные — из любых предыдущих слоёв
+        deps = {int(rng.integers(layer_start[L - 1], layer_start[L]))}
+        extra = int(rng.integers(0, fan_in))
+        if extra:
+            deps.update(rng.integers(0, layer_start[L], size=extra).tolist())
+        dependencies.append(",".join(str(i + 1) for i in sorted(deps)))
+
+    mean = np.round(rng.uniform(1, 10, n_tasks), 2)
+    stddev = np.round(mean * rng.uniform(0.05, 0.3, n_tasks), 3)
+    return pd.DataFrame({
+        "task_id": np.arange(1, n_tasks + 1),
+        "role": [f"роль_{k + 1}" for k in rng.integers(0, n_roles, n_tasks)],
+        "dependencies": dependencies,
+        "mean": mean,
+        "stddev": stddev
+    })
+
+def write_plan_csv(path, n_tasks, n_roles=3, fan_in=2, depth=None, seed=0):
+    """Записывает синтетический план в CSV и возвращает путь"""
+    generate_plan(n_tasks, n_roles, fan_in, depth, seed).to_csv(path, index=False)
+    return path
@@ -0,0 +1,214 @@
+"""
+Замеры производительности на синтетических планах.
+
+    python -m benchmarks.run --tasks 100 1000 10000 --iterations 100 1000
+    python -m benchmarks.run --save-baseline            # сохранить текущие результаты как базовые
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.25
+
+Каждый сценарий выполняется в отдельном процессе, чтобы пиковая память (RSS)
+относилась только к нему. Результаты пишутся в JSON; при наличии базового файла
+времена сравниваются с ним, и замедления больше tolerance выводятся как регрессии
+(код завершения 1).
+"""
+import argparse
+from concurrent import futures
+from contextlib import contextmanager
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from benchmarks.generator import write_plan_csv
+from services.metrics import calculate_idle_time, monte_carlo_simulation
+from services.parser import load_task_table
+from services.pool import SimulationPool
+from services.scheduler import CompiledPlan, build_schedule, compile_plan
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+def _peak_rss_mb():
+    """Пиковая память процесса и его дочерних процессов, МБ (ru_maxrss в Linux — в КБ)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1 if sys.platform == "darwin" else 1024
+    return own * scale / 2**20, children * scale / 2**20
+
+@contextmanager
+def _working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def _scenario_load(csv_path, n_iter):
+    load_task_table(csv_path)
+
+def _scenario_build_schedule(csv_path, n_iter):
+    plan = CompiledPlan.from_table(load_task_table(csv_path))
+    start = time.perf_counter()
+    build_schedule(plan, 0.5, seed=1)
+    return time.perf_counter() - start
+
+def _scenario_idle(csv_path, n_iter):
+    tasks = build_schedule(CompiledPlan.from_table(load_task_table(csv_path)), 0.5, seed=1)
+    start = time.perf_counter()
+    calculate_idle_time(tasks)
+    return time.perf_counter() - start
+
+def _scenario_monte_carlo(csv_path, n_iter):
+    plan = compile_plan(csv_path)
+    start = time.perf_counter()
+    monte_carlo_simulation(plan, 0.5, n_iter, seed=1, use_cache=False)
+    return time.perf_counter() - start
+
+def _scenario_pipeline(csv_path, n_iter):
+    """Этапы main.py на синтетическом плане (графики и Excel пишутся во временный каталог)"""
+    import main  # импорт main включает matplotlib и графики, поэтому только в этом сценарии
+
+    percentiles = [0.3, 0.6, 0.9]
+    with tempfile.TemporaryDirectory() as tmp, _working_directory(tmp):
+        os.makedirs("output/plots")
+        with SimulationPool() as pool:
+            buffer = main.part1_3_project_buffer(0.5, 90, task_file=csv_path, n_iter=n_iter, seed=1)
+            main.part1_1_schedule_project(buffer, path=csv_path, percentile=0.5)
+            main.part1_2_explore_percentile_effect(percentiles, task_file=csv_path, n_iter=n_iter, seed=1, pool=pool)
+            main.part1_4_plot_pareto_idle_vs_duration(percentiles, task_file=csv_path, seed=1, n_iter=n_iter, pool=pool)
+            main.part1_5_multiple_percentiles(percentiles, task_file=csv_path, seed=1, pool=pool)
+            main.part1_6_plot_heatmaps(percentiles, percentiles, task_file=csv_path, seed=1, n_sim=n_iter, pool=pool)
+
+# Сценарий → (функция, единица пропускной способности)
+SCENARIOS = {
+    "load": (_scenario_load, "tasks"),
+    "build_schedule": (_scenario_build_schedule, "tasks"),
+    "idle": (_scenario_idle, "tasks"),
+    "monte_carlo": (_scenario_monte_carlo, "iterations"),
+    "pipeline": (_scenario_pipeline, None),
+}
+
+def _run_scenario(name, csv_path, n_tasks, n_iter, repeat):
+    """
+    Выполняется в отдельном процессе: лучшее время из repeat запусков и пиковая память.
+    Перед замерами сценарий запускается один раз на маленьком числе итераций,
+    чтобы время не включало импорт и JIT-компиляцию ядер
+    """
+    fn, unit = SCENARIOS[name]
+    if name != "pipeline":
+        fn(csv_path, min(n_iter, 10))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        measured = fn(csv_path, n_iter)
+        # сценарий может вернуть время только измеряемой части (без подготовки)
+        timings.append(measured if measured is not None else time.perf_counter() - start)
+
+    seconds = min(timings)
+    result = {"scenario": name, "n_tasks": n_tasks, "n_iter": n_iter, "seconds": seconds}
+    if unit is not None:
+        amount = n_iter if unit == "iterations" else n_tasks
+        result[f"{unit}_per_second"] = amount / seconds if seconds > 0 else None
+    result["peak_rss_mb"], result["children_peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+def result_key(result):
+    return f"{result['scenario']}|{result['n_tasks']}|{result['n_iter']}"
+
+def run_benchmarks(task_counts, iteration_counts, scenarios, n_roles=3, fan_in=2, depth=None, repeat=1, workdir=None):
+    """
+    Запускает сценарии для всех размеров планов; сценарии без итераций
+    (загрузка, одно расписание, простой) — один раз на размер плана.
+    Ошибка сценария записывается в результат, а не прерывает замеры
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n_tasks in task_counts:
+            csv_path = write_plan_csv(os.path.join(tmp, f"plan_{n_tasks}.csv"), n_tasks, n_roles, fan_in, depth)
+            for name in scenarios:
+                iterations = iteration_counts if name in ("monte_carlo", "pipeline") else [0]
+                for n_iter in iterations:
+                    with futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        future = executor.submit(_run_scenario, name, csv_path, n_tasks, n_iter, repeat)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = {"scenario": name, "n_tasks": n_tasks, "n_iter": n_iter, "error": repr(e)}
+                    results.append(result)
+                    print(_format_result(result), flush=True)
+    return results
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """
+    Сравнивает времена с базовыми. Сценарии, у которых базовое время меньше
+    min_seconds, не считаются регрессиями: на таких временах велик шум.
+
+    :return: список (ключ, время, базовое время, отношение) для замедлений больше tolerance
+    """
+    base = {result_key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        reference = base.get(result_key(result))
+        if reference is None or "seconds" not in result or "seconds" not in reference:
+            continue
+        ratio = result["seconds"] / reference["seconds"] if reference["seconds"] > 0 else float("inf")
+        result["baseline_seconds"] = reference["seconds"]
+        result["ratio"] = ratio
+        if ratio > 1 + tolerance and reference["seconds"] >= min_seconds:
+            regressions.append((result_key(result), result["seconds"], reference["seconds"], ratio))
+    return regressions
+
+def _format_result(result):
+    head = f"{result['scenario']:<15} tasks={result['n_tasks']:<8} iter={result['n_iter']:<8}"
+    if "error" in result:
+        return f"{head} ОШИБКА: {result['error']}"
+    rate = next((f"{value:,.0f} {key.replace('_per_second', '')}/с" for key, value in result.items()
+                 if key.endswith("_per_second") and value), "")
+    return f"{head} {result['seconds']:9.3f} с  {rate:<22} RSS {result['peak_rss_mb']:.0f} МБ"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических планах")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[100, 1000, 10000], help="размеры планов")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100, 1000], help="числа итераций Монте-Карло")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--roles", type=int, default=3)
+    parser.add_argument("--fan-in", type=int, default=2)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3, help="повторов сценария (берётся лучшее время)")
+    parser.add_argument("--output", default=os.path.join(ROOT, "output", "benchmarks.json"))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты в файл базовых")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое замедление относительно базовых")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="минимальное базовое время для сравнения")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.tasks, args.iterations, args.scenarios, args.roles, args.fan_in,
+                             args.depth, args.repeat)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "parameters": {"roles": args.roles, "fan_in": args.fan_in, "depth": args.depth, "repeat": args.repeat},
+        "results": results
+    }
+
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_seconds)
+
+    output = args.baseline if args.save_baseline else args.output
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+    for key, seconds, reference, ratio in regressions:
+        print(f"РЕГРЕССИЯ {key}: {seconds:.3f} с против {reference:.3f} с (x{ratio:.2f})")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,250 @@
 import numpy as np
-from scipy.stats import lognorm
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+def lognorm_params(mean, stddev):
+    """
+    Параметры логнормального распределения (s, scale) по среднему и абсолютному отклонению.
+    Работает как со скалярами, так и с массивами
+    """
+    a = 1 + (stddev / mean) ** 2
+    s = np.sqrt(np.log(a))
+    scale = mean / np.sqrt(a)
+    return s, scale
+
+# Поля расписания задачи; в TaskTable.schedule это строки матрицы (6, n_tasks)
+SCHEDULE_FIELDS = (
+    "planned_duration", "planned_start_time", "planned_end_time",
+    "real_duration", "real_start_time", "real_end_time"
+)
+
+def _schedule_field(k):
+    """Свойство Task, читающее и пишущее k-ю строку матрицы расписания (NaN — не рассчитано)"""
+    def get(self):
+        value = self._schedule[k, self._row]
+        return None if value != value else float(value)
+
+    def set(self, value):
+        self._schedule[k, self._row] = np.nan if value is None else value
+
+    return property(get, set)
 
 class Task:
-    def __init__(self, task_id, role, dependencies, mean, stddev):
+    """
+    Задача проекта. Поля расписания хранятся не в объекте, а в строке матрицы
+    расписания: у задачи из TaskTable это столбец общей матрицы таблицы,
+    у отдельно созданной задачи — собственная матрица из одного столбца.
+    Задача плана (pinned) не переносится в другие таблицы: её строкой
+    пользуется сам план, в том числе план файла из кэша compile_plan
+    """
+    __slots__ = ("task_id", "role", "dependencies", "mean", "stddev", "_schedule", "_row", "pinned")
+
+    def __init__(self, task_id, role, dependencies, mean, stddev, schedule=None, row=0, pinned=False):
         self.task_id = int(task_id)
         self.role = role
         self.dependencies = dependencies
         self.mean = float(mean)
         self.stddev = float(stddev)
-        self.planned_duration = None
-        self.planned_start_time = None
-        self.planned_end_time = None
-        self.real_duration = None
-        self.real_start_time = None
-        self.real_end_time = None
+        if schedule is None:
+            schedule = np.full((len(SCHEDULE_FIELDS), 1), np.nan)
+        self._schedule = schedule
+        self._row = row
+        self.pinned = pinned
+
+    planned_duration = _schedule_field(0)
+    planned_start_time = _schedule_field(1)
+    planned_end_time = _schedule_field(2)
+    real_duration = _schedule_field(3)
+    real_start_time = _schedule_field(4)
+    real_end_time = _schedule_field(5)
 
-    def sample_durations(self, percentile, seed=None):
+    def bind(self, schedule, row):
         """
-        Расчитывает плановые и фактические начала, длительности и концы задач
+        Переносит расписание задачи в столбец row матрицы schedule (например, TaskTable.schedule).
+        Задачу плана (pinned) перенести нельзя — ValueError
         """
-        np.random.seed(seed)
+        if self.pinned:
+            raise ValueError(f"Задача {self.task_id} принадлежит плану и не переносится в другую таблицу")
+        schedule[:, row] = self._schedule[:, self._row]
+        self._schedule = schedule
+        self._row = row
+
+    def reset(self):
+        self._schedule[:, self._row] = np.nan
+
+def schedule_matrix(tasks):
+    """
+    Матрица расписания (6, n_tasks) для списка задач в их порядке.
+    Задачи одной таблицы читаются одним срезом общей матрицы, остальные — по полям
+    """
+    if isinstance(tasks, TaskTable):
+        return tasks.schedule
+    if tasks and all(task._schedule is tasks[0]._schedule for task in tasks):
+        rows = np.fromiter((task._row for task in tasks), dtype=np.intp, count=len(tasks))
+        return tasks[0]._schedule[:, rows]
+    matrix = np.full((len(SCHEDULE_FIELDS), len(tasks)), np.nan)
+    for j, task in enumerate(tasks):
+        matrix[:, j] = task._schedule[:, task._row]
+    return matrix
+
+class TaskTable:
+    """
+    Таблица задач в виде столбцов (struct-of-arrays):
+    - task_ids: id задач в порядке файла
+    - roles, role_ids: список ролей (по алфавиту) и код роли каждой задачи
+    - mean, stddev: параметры длительностей
+    - dep_offsets, dep_indices: предшественники в формате CSR
+      (предшественники задачи j — dep_indices[dep_offsets[j]:dep_offsets[j + 1]])
+    - order: индексы задач в топологическом порядке
+    - schedule: матрица расписания (6, n_tasks) со строками SCHEDULE_FIELDS;
+      строки доступны и по именам (planned_duration, real_start_time, ...)
+
+    При создании проверяет, что зависимости не образуют циклов
+    (если порядок order не передан готовым)
+    """
+    def __init__(self, task_ids, roles, role_ids, mean, stddev, dep_offsets, dep_indices, order=None):
+        self.task_ids = np.asarray(task_ids, dtype=np.int64)
+        self.roles = list(roles)
+        self.role_ids = np.asarray(role_ids, dtype=np.intp)
+        self.mean = np.asarray(mean, dtype=float)
+        self.stddev = np.asarray(stddev, dtype=float)
+        self.dep_offsets = np.asarray(dep_offsets, dtype=np.intp)
+        self.dep_indices = np.asarray(dep_indices, dtype=np.intp)
+        self.order = self._topological_order() if order is None else np.asarray(order, dtype=np.intp)
+
+        self.schedule = np.full((len(SCHEDULE_FIELDS), len(self.task_ids)), np.nan)
+        for k, name in enumerate(SCHEDULE_FIELDS):
+            setattr(self, name, self.schedule[k])
+
+    @classmethod
+    def from_ids(cls, task_ids, roles, role_ids, mean, stddev, dep_counts, dep_ids):
+        """
+        Строит таблицу по зависимостям, заданным id задач.
+
+        :param dep_counts: число предшественников каждой задачи
+        :param dep_ids: id предшественников всех задач подряд
+        """
+        task_ids = np.asarray(task_ids, dtype=np.int64)
+        dep_ids = np.asarray(dep_ids, dtype=np.int64)
+
+        sorter = np.argsort(task_ids, kind="stable")
+        sorted_ids = task_ids[sorter]
+        duplicated = np.unique(sorted_ids[1:][sorted_ids[1:] == sorted_ids[:-1]])
+        if len(duplicated):
+            raise ValueError(f"Повторяющиеся id задач: {duplicated.tolist()}")
+
+        # id предшественника → индекс задачи через двоичный поиск по отсортированным id
+        position = np.searchsorted(sorted_ids, dep_ids)
+        position[position == len(sorted_ids)] = 0
+        known = sorted_ids[position] == dep_ids if len(sorted_ids) else np.zeros(len(dep_ids), dtype=bool)
+        if not known.all():
+            raise ValueError(f"Неизвестные предшественники: {np.unique(dep_ids[~known]).tolist()}")
 
-        a = 1 + (self.stddev / self.mean) ** 2
-        s = np.sqrt(np.log(a))
-        scale = self.mean / np.sqrt(a)
-        
-        self.planned_duration = lognorm.ppf(percentile, s=s, scale=scale)
-        self.real_duration = lognorm.rvs(s=s, scale=scale)
+        dep_offsets = np.zeros(len(task_ids) + 1, dtype=np.intp)
+        dep_offsets[1:] = np.cumsum(dep_counts)
+        return cls(task_ids, roles, role_ids, mean, stddev, dep_offsets, sorter[position])
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """Таблица по списку объектов Task"""
+        roles = sorted({task.role for task in tasks})
+        role_index = {role: k for k, role in enumerate(roles)}
+        return cls.from_ids(
+            task_ids=[task.task_id for task in tasks],
+            roles=roles,
+            role_ids=[role_index[task.role] for task in tasks],
+            mean=[task.mean for task in tasks],
+            stddev=[task.stddev for task in tasks],
+            dep_counts=[len(task.dependencies) for task in tasks],
+            dep_ids=[dep for task in tasks for dep in task.dependencies]
+        )
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    def predecessors(self, j):
+        """Индексы предшественников задачи j"""
+        return self.dep_indices[self.dep_offsets[j]:self.dep_offsets[j + 1]]
 
     def reset(self):
-        self.planned_duration = None
-        self.planned_start_time = None
-        self.planned_end_time = None
-        self.real_duration = None
-        self.real_start_time = None
-        self.real_end_time = None
+        """Сбрасывает расписание всех задач одной операцией"""
+        self.schedule.fill(np.nan)
+
+    def to_tasks(self, pinned=False):
+        """
+        Список объектов Task — для кода, работающего с задачами по одной (диаграмма Ганта, экспорт).
+        Задачи — представления строк таблицы: их поля расписания читаются из schedule
+
+        :param pinned: задачи принадлежат плану и не переносятся в другие таблицы (см. Task.bind)
+        """
+        return [
+            Task(
+                task_id=self.task_ids[j],
+                role=self.roles[self.role_ids[j]],
+                dependencies=self.task_ids[self.predecessors(j)].tolist(),
+                mean=self.mean[j],
+                stddev=self.stddev[j],
+                schedule=self.schedule,
+                row=j,
+                pinned=pinned
+            )
+            for j in range(len(self))
+        ]
+
+    def _topological_order(self):
+        """
+        Алгоритм Кана по уровням: за шаг снимаются все задачи текущего фронта.
+        Порядок тот же, что у алгоритма Кана с очередью FIFO: сначала задачи без
+        предшественников в порядке файла, затем каждая задача встаёт в очередь
+        при снятии последнего предшественника, вслед за ранее поставленными.
+        При циклах — ValueError со списком задач, лежащих на циклах
+        """
+        n = len(self)
+        counts = np.diff(self.dep_offsets)
+        in_degree = counts.copy()
+
+        # Последователи в формате CSR; внутри предшественника — в порядке файла
+        dependents = np.repeat(np.arange(n), counts)[np.argsort(self.dep_indices, kind="stable")]
+        succ_offsets = np.zeros(n + 1, dtype=np.intp)
+        succ_offsets[1:] = np.cumsum(np.bincount(self.dep_indices, minlength=n))
+
+        frontier = np.flatnonzero(in_degree == 0)
+        levels = []
+        while len(frontier):
+            levels.append(frontier)
+            lengths = succ_offsets[frontier + 1] - succ_offsets[frontier]
+            ends = np.cumsum(lengths)
+            edges = np.repeat(succ_offsets[frontier] - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+            targets = dependents[edges]
+            in_degree -= np.bincount(targets, minlength=n)
+
+            # Готовые задачи упорядочиваются по последнему ребру, которое их освободило
+            reversed_first = np.unique(targets[::-1], return_index=True)
+            ready, last_edge = reversed_first[0], len(targets) - 1 - reversed_first[1]
+            mask = in_degree[ready] == 0
+            frontier = ready[mask][np.argsort(last_edge[mask], kind="stable")]
+
+        order = np.concatenate(levels) if levels else np.zeros(0, dtype=np.intp)
+        if len(order) < n:
+            cyclic = self._cyclic_tasks(np.setdiff1d(np.arange(n), order))
+            raise ValueError(f"Циклические зависимости между задачами: {self.task_ids[cyclic].tolist()}")
+        return order.astype(np.intp)
+
+    def _cyclic_tasks(self, rest):
+        """
+        Задачи из rest (не попавших в порядок), лежащие на циклах: компоненты сильной
+        связности из нескольких задач и задачи, зависящие от себя. Задачи, которые
+        лишь зависят от цикла, не входят
+        """
+        counts = np.diff(self.dep_offsets)
+        dependents = np.repeat(np.arange(len(self)), counts)
+        edges = np.isin(dependents, rest) & np.isin(self.dep_indices, rest)
+        local = np.full(len(self), -1, dtype=np.intp)
+        local[rest] = np.arange(len(rest))
+        preds, succs = local[self.dep_indices[edges]], local[dependents[edges]]
+
+        graph = csr_matrix((np.ones(len(preds)), (preds, succs)), shape=(len(rest), len(rest)))
+        _, labels = connected_components(graph, directed=True, connection="strong")
+        on_cycle = np.bincount(labels)[labels] > 1
+        on_cycle[preds[preds == succs]] = True
+        return rest[on_cycle]
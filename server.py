@@ -0,0 +1,291 @@
+"""
+Локальный HTTP-сервис для симуляций: импорт библиотек, компиляция плана и запуск
+пула процессов выполняются один раз при старте, а не при каждом запросе, как в main.py.
+
+    python server.py --port 8765 --plan data/tasks.csv
+
+Запросы и ответы — JSON:
+    GET  /health                 состояние сервиса
+    GET  /plans                  загруженные планы
+    POST /plans                  загрузить план: CSV в теле запроса или {"path": "tasks.csv"}
+    POST /simulate               {"plan": хэш | "path": путь, "percentiles": [0.5, 0.9], "n_iter": 1000,
+                                  "seed": 1, "sampler": "iid", "samples": false, "stream": false}
+    POST /schedule               {"plan": хэш | "path": путь, "percentile": 0.5, "seed": 1}
+
+Поле path — путь к CSV внутри каталога --data-dir (по умолчанию data);
+файлы вне него сервис не читает.
+
+При "stream": true ответ /simulate идёт построчно (NDJSON): события
+{"event": "progress", ...} по мере готовности частей и в конце {"event": "result", ...}.
+Повторный запрос с теми же планом, процентилем, n_iter, seed и sampler
+отдаётся из кэша результатов; одинаковые запросы, пришедшие одновременно, считаются один раз.
+"""
+import argparse
+import asyncio
+import json
+import os
+import numpy as np
+from services.jobs import SimulationService, summarize
+from services.pool import SimulationPool
+from services.sampling import SAMPLERS, root_seed
+from services.scheduler import configure_plan_files
+
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+          500: "Internal Server Error"}
+# Наибольшее число итераций в одном запросе /simulate: выборки держатся в памяти целиком
+MAX_N_ITER = 1_000_000
+# Наибольший размер тела запроса (CSV плана или JSON)
+MAX_BODY_BYTES = 64 * 2**20
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+async def _read_line(reader):
+    try:
+        return (await reader.readline()).decode("latin-1")
+    except ValueError:  # строка длиннее буфера потока
+        raise HttpError(400, "Слишком длинная строка запроса или заголовка")
+
+async def _read_request(reader):
+    """Метод, путь, заголовки и тело запроса; некорректный запрос — HttpError(400)"""
+    request_line = (await _read_line(reader)).strip()
+    if not request_line:
+        return None
+    parts = request_line.split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise HttpError(400, f"Некорректная строка запроса: {request_line[:100]!r}")
+    method, target, _ = parts
+    headers = {}
+    while True:
+        line = await _read_line(reader)
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get("content-length", "0")
+    if not length.isdigit():
+        raise HttpError(400, f"Некорректный Content-Length: {length[:100]!r}")
+    if int(length) > MAX_BODY_BYTES:
+        raise HttpError(413, f"Тело запроса больше {MAX_BODY_BYTES} байт")
+    body = await reader.readexactly(int(length))
+    return method, target.split("?", 1)[0], headers, body
+
+def _write_head(writer, status, content_type, chunked=False):
+    head = [f"HTTP/1.1 {status} {STATUS.get(status, '')}", f"Content-Type: {content_type}", "Connection: close"]
+    if chunked:
+        head.append("Transfer-Encoding: chunked")
+    writer.write(("\r\n".join(head) + "\r\n").encode("latin-1"))
+
+async def _respond(writer, status, payload):
+    body = _dumps(payload)
+    _write_head(writer, status, "application/json; charset=utf-8")
+    writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+async def _write_chunk(writer, payload):
+    data = _dumps(payload) + b"\n"
+    writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+    await writer.drain()
+
+def _parse_json(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError as e:
+        raise HttpError(400, f"Некорректный JSON: {e}")
+    if not isinstance(request, dict):
+        raise HttpError(400, "Тело запроса должно быть объектом JSON")
+    return request
+
+def _plan_info(plan):
+    return {"plan": plan.digest(), "n_tasks": plan.n_tasks, "roles": list(plan.roles)}
+
+def _data_path(data_dir, path):
+    """Путь к CSV из запроса: только внутри каталога data_dir (без выхода через .. и ссылки)"""
+    if data_dir is None:
+        raise HttpError(400, "Загрузка планов по пути отключена: передайте CSV в теле запроса")
+    if not isinstance(path, str) or not path:
+        raise HttpError(400, "path должен быть непустой строкой")
+    root = os.path.realpath(data_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise HttpError(400, f"path должен указывать на файл внутри каталога данных: {path!r}")
+    if not os.path.isfile(resolved):
+        raise HttpError(404, f"Нет файла: {path}")
+    return resolved
+
+async def _resolve_plan(service, data_dir, request):
+    if "plan" in request:
+        try:
+            return service.plan(request["plan"])
+        except KeyError as e:
+            raise HttpError(404, e.args[0])
+    if "path" in request:
+        return await service.add_plan(_data_path(data_dir, request["path"]))
+    raise HttpError(400, "Нужен план: поле plan (хэш загруженного плана) или path (путь к CSV)")
+
+def _percentile(value):
+    """Процентиль задач из запроса: число строго между 0 и 1"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < 1:
+        raise HttpError(400, f"Процентиль должен быть числом в интервале (0, 1): {value!r}")
+    return float(value)
+
+def _seed(value):
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+        raise HttpError(400, f"seed должен быть неотрицательным целым: {value!r}")
+    return value
+
+def _simulation_params(request):
+    """Проверенные параметры /simulate: (percentiles, n_iter, seed, sampler)"""
+    percentiles = request.get("percentiles", [request.get("percentile", 0.5)])
+    if not isinstance(percentiles, list) or not percentiles:
+        raise HttpError(400, "percentiles должен быть непустым списком")
+    percentiles = [_percentile(p) for p in percentiles]
+    n_iter = request.get("n_iter", 1000)
+    if isinstance(n_iter, bool) or not isinstance(n_iter, int) or not 1 <= n_iter <= MAX_N_ITER:
+        raise HttpError(400, f"n_iter должен быть целым от 1 до {MAX_N_ITER}: {n_iter!r}")
+    sampler = request.get("sampler", "iid")
+    if sampler not in SAMPLERS:
+        raise HttpError(400, f"Неизвестная стратегия выборки: {sampler!r}. Доступны: {', '.join(SAMPLERS)}")
+    # без seed сервис выбирает его сам и возвращает в ответе, чтобы прогон можно было повторить
+    seed = _seed(request.get("seed"))
+    return percentiles, n_iter, root_seed(None) if seed is None else seed, sampler
+
+async def _simulate(service, data_dir, request, writer):
+    percentiles, n_iter, seed, sampler = _simulation_params(request)
+    plan = await _resolve_plan(service, data_dir, request)
+    events = asyncio.Queue()
+
+    def progress(p):
+        return lambda done, total: events.put_nowait({"event": "progress", "percentile": p, "done": done, "total": total})
+
+    async def run():
+        parts = await asyncio.gather(*(
+            service.simulate(plan, p, n_iter, seed, sampler, progress(p) if request.get("stream") else None)
+            for p in percentiles
+        ))
+        results = {}
+        for p, (durations, idle) in zip(percentiles, parts):
+            results[f"{p:g}"] = summarize(durations, idle)
+            if request.get("samples"):
+                results[f"{p:g}"]["durations"] = durations
+                results[f"{p:g}"]["idle_samples"] = idle
+        return {"plan": plan.digest(), "seed": seed, "sampler": sampler, "results": results}
+
+    if not request.get("stream"):
+        await _respond(writer, 200, await run())
+        return
+
+    _write_head(writer, 200, "application/x-ndjson; charset=utf-8", chunked=True)
+    writer.write(b"\r\n")
+    task = asyncio.ensure_future(run())
+    while not task.done():
+        getter = asyncio.ensure_future(events.get())
+        await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            await _write_chunk(writer, getter.result())
+        else:
+            getter.cancel()
+    while not events.empty():
+        await _write_chunk(writer, events.get_nowait())
+    try:
+        await _write_chunk(writer, {"event": "result", **task.result()})
+    except Exception as e:
+        await _write_chunk(writer, {"event": "error", "error": str(e)})
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+async def _route(service, data_dir, method, path, headers, body, writer):
+    if path == "/health" and method == "GET":
+        await _respond(writer, 200, {"status": "ok", "workers": service.pool.max_workers, "plans": len(service.plans)})
+    elif path == "/plans" and method == "GET":
+        await _respond(writer, 200, [_plan_info(plan) for plan in service.plans.values()])
+    elif path == "/plans" and method == "POST":
+        if headers.get("content-type", "").startswith("application/json"):
+            source = _data_path(data_dir, _parse_json(body).get("path"))
+        else:
+            source = body
+        await _respond(writer, 200, _plan_info(await service.add_plan(source)))
+    elif path == "/simulate" and method == "POST":
+        await _simulate(service, data_dir, _parse_json(body), writer)
+    elif path == "/schedule" and method == "POST":
+        request = _parse_json(body)
+        percentile, seed = _percentile(request.get("percentile", 0.5)), _seed(request.get("seed"))
+        plan = await _resolve_plan(service, data_dir, request)
+        schedule = await service.schedule(plan, percentile, seed)
+        await _respond(writer, 200, {"plan": plan.digest(), **schedule})
+    elif path in ("/health", "/plans", "/simulate", "/schedule"):
+        raise HttpError(405, f"Метод {method} не поддерживается для {path}")
+    else:
+        raise HttpError(404, f"Неизвестный путь: {path}")
+
+async def handle(service, data_dir, reader, writer):
+    try:
+        try:
+            request = await _read_request(reader)
+            if request is None:
+                return
+            await _route(service, data_dir, *request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except HttpError as e:
+            await _respond(writer, e.status, {"error": str(e)})
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            await _respond(writer, 400, {"error": str(e)})
+        except Exception as e:
+            await _respond(writer, 500, {"error": repr(e)})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass  # клиент закрыл соединение
+    finally:
+        writer.close()
+
+async def serve(host, port, workers=None, plans=(), warm_up=True, data_dir="data"):
+    """
+    :param plans: CSV, загружаемые при старте (задаются владельцем сервиса, поэтому не ограничены data_dir)
+    :param data_dir: каталог CSV, доступных клиентам по полю path (None — path запрещён)
+    """
+    with SimulationPool(workers) as pool:
+        service = SimulationService(pool)
+        for source in plans:
+            plan = await service.add_plan(source)
+            # прогрев: процессы пула подключают план и компилируют ядра до первого запроса
+            if warm_up:
+                await service.simulate(plan, 0.5, 4 * pool.max_workers, seed=0)
+            print(f"План {source}: {plan.digest()}")
+
+        server = await asyncio.start_server(lambda r, w: handle(service, data_dir, r, w), host, port)
+        print(f"Сервис слушает http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP-сервис симуляций")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="процессов пула (по умолчанию — число ядер)")
+    parser.add_argument("--plan", action="append", default=[], help="CSV, загружаемый при старте (можно несколько)")
+    parser.add_argument("--plan-dir", default="output/plans", help="каталог двоичных копий планов")
+    parser.add_argument("--data-dir", default="data",
+                        help="каталог CSV, доступных клиентам по полю path (пустая строка — path запрещён)")
+    parser.add_argument("--no-warm-up", action="store_true", help="не прогревать пул при старте")
+    args = parser.parse_args(argv)
+
+    configure_plan_files(args.plan_dir)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.plan, not args.no_warm_up, args.data_dir or None))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
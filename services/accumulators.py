@@ -0,0 +1,185 @@
+import numpy as np
+
+class MomentAccumulator:
+    """
+    Среднее и дисперсия по потоку значений (Уэлфорд, объединение пакетов по Чану).
+    Аккумуляторы из разных процессов объединяются через merge
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        other = MomentAccumulator()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+class HistogramAccumulator:
+    """
+    Гистограмма с фиксированной шириной корзины, привязанной к нулю:
+    корзина k покрывает [k * bin_width, (k + 1) * bin_width).
+    Диапазон расширяется по мере поступления данных, поэтому гистограммы
+    из разных процессов складываются без перебинирования
+    """
+    def __init__(self, bin_width=0.01):
+        self.bin_width = bin_width
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def _grow(self, lo, hi):
+        if not len(self.counts):
+            self.offset = lo
+            self.counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            return
+        new_lo = min(lo, self.offset)
+        new_hi = max(hi, self.offset + len(self.counts) - 1)
+        if new_lo == self.offset and new_hi == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+        counts[self.offset - new_lo:self.offset - new_lo + len(self.counts)] = self.counts
+        self.offset, self.counts = new_lo, counts
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        bins = np.floor(values / self.bin_width).astype(np.int64)
+        lo, hi = int(bins.min()), int(bins.max())
+        self._grow(lo, hi)
+        self.counts += np.bincount(bins - self.offset, minlength=len(self.counts))
+
+    def merge(self, other):
+        if other.bin_width != self.bin_width:
+            raise ValueError("Нельзя объединить гистограммы с разной шириной корзины")
+        if not len(other.counts):
+            return
+        self._grow(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+
+    def edges(self):
+        return (self.offset + np.arange(len(self.counts) + 1)) * self.bin_width
+
+    def quantile(self, q):
+        """
+        Квантили (q от 0 до 1, скаляр или массив) с линейной интерполяцией внутри корзины.
+        Погрешность не превышает ширины корзины
+        """
+        q = np.asarray(q, dtype=float)
+        cumulative = np.cumsum(self.counts)
+        target = q * cumulative[-1]
+        k = np.clip(np.searchsorted(cumulative, target, side="left"), 0, len(self.counts) - 1)
+        before = np.where(k > 0, cumulative[k - 1], 0)
+        inside = np.divide(target - before, self.counts[k],
+                           out=np.zeros_like(target), where=self.counts[k] > 0)
+        return (self.offset + k + np.clip(inside, 0, 1)) * self.bin_width
+
+class SimulationSummary:
+    """
+    Потоковая сводка прогона Монте-Карло: моменты и гистограмма длительности проекта
+    и суммарный простой по ролям. Память не зависит от числа итераций
+    """
+    def __init__(self, roles, bin_width=0.01):
+        self.roles = list(roles)
+        self.durations = MomentAccumulator()
+        self.histogram = HistogramAccumulator(bin_width)
+        self.idle_sums = np.zeros(len(self.roles))
+
+    @property
+    def count(self):
+        return self.durations.count
+
+    def update(self, durations, idle):
+        """
+        :param durations: длительности проекта пакета итераций
+        :param idle: матрица простоя (n_roles, n_iter) того же пакета
+        """
+        self.durations.update(durations)
+        self.histogram.update(durations)
+        self.idle_sums += idle.sum(axis=1)
+
+    def merge(self, other):
+        if other.roles != self.roles:
+            raise ValueError("Нельзя объединить сводки с разным набором ролей")
+        self.durations.merge(other.durations)
+        self.histogram.merge(other.histogram)
+        self.idle_sums += other.idle_sums
+        return self
+
+    def quantile(self, q):
+        return self.histogram.quantile(q)
+
+    def mean_idle(self):
+        """Средний простой по ролям: роль → значение"""
+        count = max(self.count, 1)
+        return {role: self.idle_sums[k] / count for k, role in enumerate(self.roles)}
+
+class CriticalityAccumulator:
+    """
+    Индекс критичности задач и вклад ролей в перерасход срока по потоку итераций.
+
+    - critical_counts: сколько раз задача лежала на критической цепочке итерации
+      (цепочке, определившей длительность проекта)
+    - role_overrun: сумма по итерациям с перерасходом (длительность больше плановой)
+      превышений фактических длительностей над плановыми у задач цепочки этой роли
+    """
+    def __init__(self, task_ids, roles):
+        self.task_ids = list(task_ids)
+        self.roles = list(roles)
+        self.count = 0
+        self.critical_counts = np.zeros(len(self.task_ids), dtype=np.int64)
+        self.role_overrun = np.zeros(len(self.roles))
+
+    def update(self, critical_counts, role_overrun, n_iter):
+        self.critical_counts += critical_counts
+        self.role_overrun += role_overrun
+        self.count += n_iter
+
+    def merge(self, other):
+        if other.task_ids != self.task_ids or other.roles != self.roles:
+            raise ValueError("Нельзя объединить критичность разных планов")
+        self.update(other.critical_counts, other.role_overrun, other.count)
+        return self
+
+    def criticality(self):
+        """Доля итераций, в которых задача была критической: id задачи → значение"""
+        count = max(self.count, 1)
+        return {task_id: self.critical_counts[j] / count for j, task_id in enumerate(self.task_ids)}
+
+    def mean_role_overrun(self):
+        """Средний вклад роли в перерасход на итерацию: роль → значение"""
+        count = max(self.count, 1)
+        return {role: self.role_overrun[k] / count for k, role in enumerate(self.roles)}
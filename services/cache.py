@@ -0,0 +1,119 @@
+from collections import OrderedDict
+import hashlib
+import os
+import numpy as np
+
+# Меняется при изменении алгоритма симуляции, чтобы старые файлы кэша не использовались
+CACHE_VERSION = 4
+
+class ResultCache:
+    """
+    Кэш результатов Монте-Карло, адресуемый по содержимому:
+    ключ — (хэш плана, процентиль, число итераций, seed, стратегия выборки).
+
+    Результаты хранятся в памяти с вытеснением давно не используемых (LRU)
+    и, если задан каталог, дублируются в .npz-файлы на диске.
+    Прогоны с seed=None не кэшируются — каждый такой прогон случаен.
+    """
+    def __init__(self, max_bytes=256 * 2**20, directory=None, max_files=1000):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(plan, percentile, n_iter, seed, sampler="iid"):
+        """
+        Ключ прогона. Процентиль округляется до 12 знаков, чтобы 0.3 и 0.30000000000000004
+        (результат np.arange) считались одним прогоном
+        """
+        if seed is None:
+            return None
+        raw = f"v{CACHE_VERSION}|{plan.digest()}|{float(percentile):.12g}|{int(n_iter)}|{seed}|{sampler}"
+        return hashlib.sha256(raw.encode("ascii")).hexdigest()
+
+    def get(self, key):
+        """Возвращает копию (durations, idle) или None: вызывающий может изменять массивы"""
+        if key is None:
+            return None
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tuple(array.copy() for array in self._entries[key])
+
+        value = self._load(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, value)
+        return tuple(array.copy() for array in value)
+
+    def put(self, key, durations, idle):
+        """Запоминает копию результата: массивы вызывающего остаются его собственными"""
+        if key is None:
+            return
+        value = (np.array(durations), np.array(idle))
+        self._remember(key, value)
+        self._store(key, value)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def _remember(self, key, value):
+        if key in self._entries:
+            return
+        # собственные копии кэша защищены от случайного изменения
+        for array in value:
+            array.setflags(write=False)
+        self._entries[key] = value
+        self._size += sum(array.nbytes for array in value)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= sum(array.nbytes for array in evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        path = self._path(key)
+        with np.load(path) as data:
+            value = (data["durations"], data["idle"])
+        os.utime(path)  # время доступа для LRU на диске
+        return value
+
+    def _store(self, key, value):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, durations=value[0], idle=value[1])
+        os.replace(tmp_path, path)
+
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+        if len(files) > self.max_files:
+            files.sort(key=os.path.getmtime)
+            for old in files[:len(files) - self.max_files]:
+                os.remove(old)
+
+# Кэш процесса по умолчанию; настраивается через configure_result_cache
+_result_cache = ResultCache()
+
+def result_cache():
+    return _result_cache
+
+def configure_result_cache(max_bytes=256 * 2**20, directory=None, max_files=1000):
+    """
+    Заменяет кэш процесса, например чтобы включить хранение на диске
+    """
+    global _result_cache
+    _result_cache = ResultCache(max_bytes=max_bytes, directory=directory, max_files=max_files)
+    return _result_cache
@@ -1,45 +1,273 @@
+"""
+Экспорт расписаний и результатов симуляций.
+
+Таблицы собираются по столбцам из массивов (без словаря на каждую строку) и пишутся
+потоково, частями по CHUNK_ROWS строк. Формат выбирается по расширению файла:
+- .xlsx — openpyxl в режиме write_only (строки сразу уходят во временный файл);
+- .csv — pandas, частями с дозаписью;
+- .parquet — pyarrow.parquet.ParquetWriter, часть — группа строк (pyarrow необязателен).
+
+Листы таблицы, кроме первого, в CSV и Parquet пишутся в соседние файлы
+с суффиксом листа: schedule.csv → schedule.idle.csv.
+"""
+import os
+import numpy as np
 import pandas as pd
+from openpyxl import Workbook
+from models.task import SCHEDULE_FIELDS, TaskTable, schedule_matrix
+from services.profiling import profiled
 
-def export_schedule_to_excel(tasks, filename, project_duration, idle_time=None):
-    # === Первый лист: План проекта ===
-    data = []
-
-    for task in tasks:
-        data.append({
-            "ID": task.task_id,
-            "Роль": task.role,
-            "Предшественники": ", ".join(map(str, task.dependencies)) if task.dependencies else "",
-            "Ожидаемое ср.время": task.mean,
-            "Абсолютное отклонение": task.stddev,
-            "Запланированное начало":round(task.planned_start_time, 2),
-            "Запланированная длительность":round(task.planned_duration, 2),
-            "Запланированный конец":round(task.planned_end_time, 2),
-            "Фактическое начало":round(task.real_start_time, 2),
-            "Фактическая длительность":round(task.real_duration, 2),
-            "Фактический конец":round(task.real_end_time, 2)
-        })
-
-    df_schedule = pd.DataFrame(data)
-    df_schedule.loc[len(df_schedule.index)] = {
-        "ID": "ИТОГО",
-        "Реальное окончание": round(project_duration, 2)
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow нужен только для Parquet
+    pyarrow = None
+
+# Строк в одной части при потоковой записи
+CHUNK_ROWS = 65_536
+# Наибольшее число строк листа Excel (вместе с заголовком)
+EXCEL_MAX_ROWS = 1_048_576
+
+# Столбцы листа плана: поле расписания → заголовок
+SCHEDULE_COLUMNS = {
+    "planned_start_time": "Запланированное начало",
+    "planned_duration": "Запланированная длительность",
+    "planned_end_time": "Запланированный конец",
+    "real_start_time": "Фактическое начало",
+    "real_duration": "Фактическая длительность",
+    "real_end_time": "Фактический конец",
+}
+
+class Sheet:
+    """
+    Лист таблицы: имя листа Excel, суффикс файла для CSV и Parquet,
+    заголовки столбцов и части — словари заголовок → массив одинаковой длины
+    """
+    def __init__(self, name, suffix, columns, chunks, n_rows=None):
+        self.name = name
+        self.suffix = suffix
+        self.columns = list(columns)
+        self.chunks = chunks
+        self.n_rows = n_rows
+
+def _column_chunks(columns, chunk_rows=CHUNK_ROWS):
+    """Части таблицы, заданной словарём столбцов"""
+    n = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, n, chunk_rows):
+        yield {name: values[start:start + chunk_rows] for name, values in columns.items()}
+
+def _cells(values):
+    """Значения столбца для openpyxl: числа numpy → Python, NaN → пустая ячейка"""
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.where(np.isnan(values), None, values).tolist()
+    if values.dtype.kind == "O":
+        return [None if value is None or value != value else value for value in values.tolist()]
+    return values.tolist()
+
+def _write_xlsx(filename, sheets):
+    workbook = Workbook(write_only=True)
+    for sheet in sheets:
+        if sheet.n_rows is not None and sheet.n_rows + 1 > EXCEL_MAX_ROWS:
+            raise ValueError(f"Лист «{sheet.name}»: {sheet.n_rows} строк не помещаются в Excel, "
+                             "используйте .csv или .parquet")
+        worksheet = workbook.create_sheet(sheet.name)
+        worksheet.append(sheet.columns)
+        for chunk in sheet.chunks:
+            for row in zip(*(_cells(chunk[name]) for name in sheet.columns)):
+                worksheet.append(row)
+    workbook.save(filename)
+
+def _write_csv(filename, sheet):
+    header = True
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        for chunk in sheet.chunks:
+            pd.DataFrame(chunk, columns=sheet.columns).to_csv(f, index=False, header=header)
+            header = False
+        if header:
+            pd.DataFrame(columns=sheet.columns).to_csv(f, index=False)
+
+def _write_parquet(filename, sheet):
+    if pyarrow is None:
+        raise ImportError("Для записи Parquet нужен пакет pyarrow")
+    writer = None
+    try:
+        for chunk in sheet.chunks:
+            batch = pyarrow.table({name: chunk[name] for name in sheet.columns})
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(filename, batch.schema)
+            writer.write_table(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pyarrow.parquet.write_table(pyarrow.table({name: [] for name in sheet.columns}), filename)
+
+def write_sheets(filename, sheets):
+    """
+    Записывает листы в файл формата по расширению (.xlsx, .csv, .parquet).
+
+    :return: список записанных файлов
+    """
+    stem, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    if ext == ".xlsx":
+        _write_xlsx(filename, sheets)
+        return [filename]
+    if ext not in (".csv", ".parquet"):
+        raise ValueError(f"Неизвестный формат экспорта: {ext}")
+
+    written = []
+    for k, sheet in enumerate(sheets):
+        path = filename if k == 0 else f"{stem}.{sheet.suffix}{ext}"
+        (_write_csv if ext == ".csv" else _write_parquet)(path, sheet)
+        written.append(path)
+    return written
+
+def _dependency_strings(table):
+    """
+    Предшественники задач строками "1, 2, 5" по CSR таблицы: все id соединяются
+    в одну строку, и строка задачи — её срез по смещениям в символах
+    """
+    dep_ids = table.task_ids[table.dep_indices].astype(str).tolist()
+    joined = ", ".join(dep_ids)
+    # начало id каждого ребра в общей строке; последний элемент — конец строки + разделитель
+    char_offsets = np.zeros(len(dep_ids) + 1, dtype=np.int64)
+    char_offsets[1:] = np.cumsum(np.fromiter(map(len, dep_ids), dtype=np.int64, count=len(dep_ids)) + 2)
+    starts = char_offsets[table.dep_offsets[:-1]].tolist()
+    ends = (char_offsets[table.dep_offsets[1:]] - 2).tolist()
+    return [joined[a:b] if b > a else "" for a, b in zip(starts, ends)]
+
+def _table_columns(table):
+    """Столбцы задач TaskTable прямо из её массивов (без объектов Task)"""
+    return {
+        "ID": table.task_ids,
+        "Роль": np.asarray(table.roles, dtype=object)[table.role_ids],
+        "Предшественники": _dependency_strings(table),
+        "Ожидаемое ср.время": table.mean,
+        "Абсолютное отклонение": table.stddev,
     }
 
-    # === Второй лист: Простой по ролям ===
-    if idle_time is not None:
-        idle_data = [{"Роль": role, "Простой (дней)": round(duration, 2)} for role, duration in idle_time.items()]
-        df_idle = pd.DataFrame(idle_data)
+def schedule_columns(tasks):
+    """
+    Столбцы листа плана по задачам (список Task или TaskTable):
+    поля расписания берутся из матрицы расписания целиком и округляются до 0.01
+    """
+    if isinstance(tasks, TaskTable):
+        columns = _table_columns(tasks)
     else:
-        df_idle = pd.DataFrame()
+        columns = {
+            "ID": np.array([task.task_id for task in tasks], dtype=np.int64),
+            "Роль": [task.role for task in tasks],
+            "Предшественники": [", ".join(map(str, task.dependencies)) if task.dependencies else ""
+                                for task in tasks],
+            "Ожидаемое ср.время": np.array([task.mean for task in tasks], dtype=float),
+            "Абсолютное отклонение": np.array([task.stddev for task in tasks], dtype=float),
+        }
+    schedule = schedule_matrix(tasks)
+    for field, name in SCHEDULE_COLUMNS.items():
+        columns[name] = np.round(schedule[SCHEDULE_FIELDS.index(field)], 2)
+    return columns
 
-    # === Запись в Excel с двумя листами ===
-    with pd.ExcelWriter(filename, engine="openpyxl") as writer:
-        df_schedule.to_excel(writer, index=False, sheet_name="План проекта")
-        if not df_idle.empty:
-            df_idle.to_excel(writer, index=False, sheet_name="Простой по ролям")
+def _with_total(chunks, total, names):
+    """Части листа с пустым столбцом окончания проекта и строкой «ИТОГО» в конце"""
+    for chunk in chunks:
+        yield {name: chunk.get(name, [None] * len(chunk["ID"])) for name in names}
+    yield total
 
-def export_percentile_analysis_to_excel(results, output_path):
+@profiled("export.schedule")
+def export_schedule(tasks, filename, project_duration=None, idle_time=None):
+    """
+    Экспортирует план проекта и простой по ролям.
+
+    В Excel под задачами добавляется строка «ИТОГО» с окончанием проекта
+    в отдельном столбце «Реальное окончание»; в CSV и Parquet её нет,
+    чтобы столбцы оставались однотипными.
+
+    :param tasks: список задач с рассчитанным расписанием или TaskTable
+    :param filename: путь к файлу .xlsx, .csv или .parquet
+    :param project_duration: длительность проекта для строки «ИТОГО»
+    :param idle_time: словарь роль → простой (второй лист)
+    :return: список записанных файлов
+    """
+    columns = schedule_columns(tasks)
+    n = len(columns["ID"])
+    names = list(columns)
+
+    # === Первый лист: План проекта ===
+    if filename.lower().endswith(".xlsx") and project_duration is not None:
+        names.append("Реальное окончание")
+        chunks = _column_chunks(columns)
+        total = {name: [None] for name in names}
+        total["ID"] = ["ИТОГО"]
+        total["Реальное окончание"] = [round(project_duration, 2)]
+        chunks = _with_total(chunks, total, names)
+        sheets = [Sheet("План проекта", "schedule", names, chunks, n + 1)]
+    else:
+        sheets = [Sheet("План проекта", "schedule", names, _column_chunks(columns), n)]
+
+    # === Второй лист: Простой по ролям ===
+    if idle_time:
+        idle = {
+            "Роль": list(idle_time),
+            "Простой (дней)": np.round(np.array(list(idle_time.values()), dtype=float), 2)
+        }
+        sheets.append(Sheet("Простой по ролям", "idle", list(idle), _column_chunks(idle), len(idle_time)))
+
+    return write_sheets(filename, sheets)
+
+def export_schedule_to_excel(tasks, filename, project_duration, idle_time=None):
+    """Экспорт плана проекта в Excel (см. export_schedule)"""
+    return export_schedule(tasks, filename, project_duration, idle_time)
+
+@profiled("export.percentile_analysis")
+def export_percentile_analysis(results, output_path):
+    """
+    Экспортирует сводку по процентилям (список словарей-строк) в .xlsx, .csv или .parquet.
+
+    :return: DataFrame сводки
+    """
     df = pd.DataFrame(results)
-    df.to_excel(output_path, index=False)
+    columns = {name: df[name].to_numpy() for name in df.columns}
+    write_sheets(output_path, [Sheet("Sheet1", "summary", df.columns, _column_chunks(columns), len(df))])
     return df
 
+def export_percentile_analysis_to_excel(results, output_path):
+    """Экспорт сводки по процентилям в Excel (см. export_percentile_analysis)"""
+    return export_percentile_analysis(results, output_path)
+
+@profiled("export.monte_carlo_results")
+def export_monte_carlo_results(results, filename, chunk_rows=CHUNK_ROWS):
+    """
+    Экспортирует результаты Монте-Карло по итерациям: процентиль, номер итерации,
+    длительность проекта и простой каждой роли. Строки собираются частями по chunk_rows,
+    поэтому в CSV и Parquet помещаются прогоны любого размера, не создавая всю таблицу в памяти.
+
+    :param results: словарь процентиль → (durations, idle) как у parallel_monte_carlo_simulation
+                    или пара (durations, idle) одного прогона
+    :param filename: путь к файлу .xlsx, .csv или .parquet
+    :return: список записанных файлов
+    """
+    if isinstance(results, tuple):
+        results = {None: results}
+    roles = sorted({role for _, idle in results.values() for role in idle})
+    names = ["Процентиль", "Итерация", "Длительность проекта"] + [f"Простой_{role}" for role in roles]
+
+    def chunks():
+        for p, (durations, idle) in results.items():
+            n = len(durations)
+            for start in range(0, n, chunk_rows):
+                stop = min(start + chunk_rows, n)
+                chunk = {
+                    "Процентиль": np.full(stop - start, np.nan if p is None else p),
+                    "Итерация": np.arange(start, stop),
+                    "Длительность проекта": np.asarray(durations[start:stop], dtype=float),
+                }
+                for role in roles:
+                    values = idle.get(role)
+                    chunk[f"Простой_{role}"] = (np.zeros(stop - start) if values is None
+                                                else np.asarray(values[start:stop], dtype=float))
+                yield chunk
+
+    n_rows = sum(len(durations) for durations, _ in results.values())
+    return write_sheets(filename, [Sheet("Итерации", "iterations", names, chunks(), n_rows)])
@@ -0,0 +1,182 @@
+import heapq
+import numpy as np
+from scipy.special import ndtri
+from models.task import TaskTable, lognorm_params
+from services.scheduler import CompiledPlan, compile_plan
+
+class IncrementalScheduler:
+    """
+    Плановое расписание для сценариев «что если»: после правки задачи
+    пересчитываются только затронутые ею задачи, а не весь план.
+
+    Плановое начало задачи зависит только от концов её предшественников и конца
+    предыдущей задачи той же роли в топологическом порядке. Поэтому после правки
+    задачи пересчитываются в порядке плана, начиная с изменённых, и дальше — только
+    последователи и следующие задачи роли тех задач, чей конец действительно изменился.
+
+    Результаты Монте-Карло адресуются хэшем плана (см. services.cache), поэтому
+    правка делает недействительными только прогоны изменённого плана: прогоны
+    исходного плана остаются в кэше и снова используются после отмены правки.
+    """
+    def __init__(self, source, percentiles):
+        """
+        :param source: путь к CSV, список задач или CompiledPlan
+        :param percentiles: процентили, для которых поддерживается плановое расписание
+        """
+        plan = compile_plan(source)
+        self.roles = list(plan.roles)
+        self.task_ids = np.array(plan.task_ids)
+        self.role_ids = np.array(plan.role_ids)
+        self.mean = np.array(plan.mean)
+        self.stddev = np.array(plan.stddev)
+        self.index = dict(plan.index)
+        self.dependencies = [plan.predecessors(j).tolist() for j in range(plan.n_tasks)]
+
+        self.schedules = {}
+        for p in percentiles:
+            planned = plan.planned_schedule(p)
+            self.schedules[p] = (planned.duration.copy(), planned.start.copy(), planned.end.copy())
+
+        self._set_order(plan.order)
+        self._plan = plan
+
+    def _set_order(self, order):
+        """Порядок задач, позиции в нём, последователи и соседи в очереди роли"""
+        n = len(self.task_ids)
+        self.order = np.asarray(order)
+        self.position = np.empty(n, dtype=np.intp)
+        self.position[self.order] = np.arange(n)
+
+        self.successors = [[] for _ in range(n)]
+        for j, deps in enumerate(self.dependencies):
+            for i in deps:
+                self.successors[i].append(j)
+
+        self.prev_in_role = np.full(n, -1, dtype=np.intp)
+        self.next_in_role = np.full(n, -1, dtype=np.intp)
+        last = {}
+        for j in self.order.tolist():
+            r = self.role_ids[j]
+            if r in last:
+                self.prev_in_role[j] = last[r]
+                self.next_in_role[last[r]] = j
+            last[r] = j
+
+    def _task_index(self, task_id):
+        if task_id not in self.index:
+            raise ValueError(f"Неизвестная задача: {task_id}")
+        return self.index[task_id]
+
+    def set_task(self, task_id, mean=None, stddev=None):
+        """
+        Меняет параметры длительности задачи.
+
+        :return: множество id задач, плановое расписание которых изменилось
+        """
+        j = self._task_index(task_id)
+        if mean is not None:
+            self.mean[j] = mean
+        if stddev is not None:
+            self.stddev[j] = stddev
+
+        s, scale = lognorm_params(self.mean[j], self.stddev[j])
+        for p, (duration, _, _) in self.schedules.items():
+            duration[j] = scale * np.exp(s * ndtri(p))
+        return self._update([j])
+
+    def add_dependency(self, task_id, dependency_id):
+        """
+        Добавляет зависимость task_id от dependency_id.
+        Зависимость, образующая цикл, отклоняется (ValueError), план не меняется
+        """
+        j, i = self._task_index(task_id), self._task_index(dependency_id)
+        if i in self.dependencies[j]:
+            return set()
+        self.dependencies[j].append(i)
+        try:
+            return self._reorder(j)
+        except ValueError:
+            self.dependencies[j].pop()
+            raise
+
+    def remove_dependency(self, task_id, dependency_id):
+        """Удаляет зависимость task_id от dependency_id"""
+        j, i = self._task_index(task_id), self._task_index(dependency_id)
+        if i not in self.dependencies[j]:
+            return set()
+        self.dependencies[j].remove(i)
+        return self._reorder(j)
+
+    def _reorder(self, j):
+        """
+        Пересчитывает топологический порядок после изменения зависимостей задачи j.
+        Кроме j, пересчёту подлежат задачи, у которых сменился предыдущий в очереди роли
+        """
+        dep_offsets, dep_indices = self._csr()
+        table = TaskTable(self.task_ids, self.roles, self.role_ids, self.mean, self.stddev,
+                          dep_offsets, dep_indices)
+        prev_in_role = self.prev_in_role
+        self._set_order(table.order)
+        changed = np.flatnonzero(self.prev_in_role != prev_in_role).tolist()
+        return self._update([j] + changed)
+
+    def _csr(self):
+        counts = [len(deps) for deps in self.dependencies]
+        dep_offsets = np.zeros(len(counts) + 1, dtype=np.intp)
+        dep_offsets[1:] = np.cumsum(counts)
+        dep_indices = np.array([i for deps in self.dependencies for i in deps], dtype=np.intp)
+        return dep_offsets, dep_indices
+
+    def _update(self, dirty):
+        """
+        Пересчитывает задачи dirty и всё, что от них зависит, для каждого процентиля.
+        Задачи берутся из кучи в порядке плана; последователи задачи ставятся
+        в кучу, только если её конец изменился
+        """
+        self._plan = None
+        affected = set()
+        for duration, start, end in self.schedules.values():
+            heap = sorted({self.position[j] for j in dirty})
+            queued = set(heap)
+            while heap:
+                j = self.order[heapq.heappop(heap)]
+                prev = self.prev_in_role[j]
+                dep_end = max((end[i] for i in self.dependencies[j]), default=0)
+                new_start = max(dep_end, end[prev] if prev >= 0 else 0)
+                new_end = new_start + duration[j]
+                if new_start == start[j] and new_end == end[j]:
+                    continue
+
+                changed = new_end != end[j]
+                start[j], end[j] = new_start, new_end
+                affected.add(int(self.task_ids[j]))
+                if not changed:
+                    continue
+                for k in self.successors[j] + [self.next_in_role[j]]:
+                    if k >= 0 and self.position[k] not in queued:
+                        queued.add(self.position[k])
+                        heapq.heappush(heap, self.position[k])
+        return affected
+
+    def project_end(self, percentile):
+        """Плановое окончание проекта для процентиля"""
+        _, _, end = self.schedules[percentile]
+        return end.max() if len(end) else 0.0
+
+    @property
+    def plan(self):
+        """
+        CompiledPlan текущего состояния (для Монте-Карло и build_schedule).
+        Плановые расписания переносятся в него готовыми
+        """
+        if self._plan is None:
+            dep_offsets, dep_indices = self._csr()
+            plan = CompiledPlan.from_arrays(
+                self.roles, task_ids=self.task_ids.copy(), role_ids=self.role_ids.copy(),
+                mean=self.mean.copy(), stddev=self.stddev.copy(),
+                dep_offsets=dep_offsets, dep_indices=dep_indices, order=self.order.copy()
+            )
+            for p, (duration, start, end) in self.schedules.items():
+                plan.remember_planned_schedule(p, duration.copy(), start.copy(), end.copy())
+            self._plan = plan
+        return self._plan
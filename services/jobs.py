@@ -0,0 +1,199 @@
+"""
+Выполнение запросов на симуляцию в долгоживущем процессе (см. server.py).
+
+Планы компилируются один раз и хранятся по хэшу; симуляции идут частями
+в тёплом SimulationPool, а готовые результаты отдаются из кэша результатов.
+Одинаковые запросы, пришедшие, пока первый ещё считается, не запускают
+второй расчёт: они ждут тот же результат и получают те же события прогресса.
+"""
+import asyncio
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import io
+import math
+import numpy as np
+from services.cache import result_cache
+from services.metrics import calculate_idle_time, calculate_project_duration, iteration_chunks
+from services.exporter import schedule_columns
+from services.parser import load_task_table
+from services.run_store import QUANTILES
+from services.sampling import root_seed
+from services.scheduler import CompiledPlan, build_schedule, compile_plan
+from services.simulation import idle_by_role, simulate_batch
+
+# Сколько загруженных планов держит сервис по умолчанию
+MAX_PLANS = 16
+# Наибольшая часть прогона: память процесса на часть — несколько матриц (n_tasks, chunk_size)
+MAX_CHUNK_SIZE = 10_000
+
+def summarize(durations, idle):
+    """
+    Сводка прогона для ответа: статистика длительности проекта и средний простой ролей
+
+    :param idle: словарь роль → массив простоя по итерациям
+    """
+    durations = np.asarray(durations)
+    quantiles = np.quantile(durations, QUANTILES) if len(durations) else [None] * len(QUANTILES)
+    return {
+        "n_iter": len(durations),
+        "mean": float(np.mean(durations)) if len(durations) else None,
+        "std": float(np.std(durations, ddof=1)) if len(durations) > 1 else None,
+        "quantiles": {f"{q:g}": None if value is None else float(value) for q, value in zip(QUANTILES, quantiles)},
+        "idle": {role: float(np.mean(values)) if len(values) else None for role, values in idle.items()},
+    }
+
+def schedule_rows(plan, percentile, seed):
+    """
+    Выполняется в процессе пула: одно расписание (как в part1_1) в виде столбцов для JSON
+    """
+    tasks = build_schedule(plan, percentile, seed)
+    columns = schedule_columns(tasks)
+    return {
+        "columns": {name: np.asarray(values).tolist() for name, values in columns.items()},
+        "project_duration": calculate_project_duration(tasks),
+        "idle": calculate_idle_time(tasks),
+    }
+
+class _Job:
+    """Считающийся прогон: общий результат и подписчики на прогресс"""
+    def __init__(self, total):
+        self.future = asyncio.get_running_loop().create_future()
+        self.listeners = []
+        self.done = 0
+        self.total = total
+
+    def advance(self, n):
+        self.done += n
+        for listener in list(self.listeners):
+            listener(self.done, self.total)
+
+class SimulationService:
+    """
+    Планы по хэшу, тёплый пул процессов и объединение одинаковых запросов.
+    Все методы вызываются из одного цикла событий asyncio
+    """
+    def __init__(self, pool, chunk_size=None, max_plans=MAX_PLANS):
+        """
+        :param pool: SimulationPool, общий для всех запросов
+        :param chunk_size: итераций в одной части (по умолчанию — примерно 4 части на процесс,
+                           но не больше MAX_CHUNK_SIZE)
+        :param max_plans: сколько планов держать загруженными; давно не использованные
+                          вытесняются вместе с их общей памятью в пуле
+        """
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.max_plans = max_plans
+        self.plans = OrderedDict()
+        self._jobs = {}
+        self._active = Counter()  # хэш плана → число выполняющихся задач
+
+    async def add_plan(self, source):
+        """
+        Компилирует план и запоминает его по хэшу.
+
+        :param source: путь к CSV на сервере (str) или содержимое CSV (bytes)
+        :return: CompiledPlan
+        """
+        if isinstance(source, bytes):
+            text = source.decode("utf-8")
+            plan = await asyncio.to_thread(lambda: CompiledPlan.from_table(load_task_table(io.StringIO(text))))
+        else:
+            plan = await asyncio.to_thread(compile_plan, source)
+        digest = plan.digest()
+        self.plans.setdefault(digest, plan)
+        self.plans.move_to_end(digest)
+        self._evict()
+        return self.plans[digest]
+
+    def plan(self, digest):
+        if digest not in self.plans:
+            raise KeyError(f"Неизвестный план: {digest}")
+        self.plans.move_to_end(digest)
+        return self.plans[digest]
+
+    def _evict(self):
+        """Вытесняет давно не использованные планы сверх max_plans (кроме тех, что сейчас считаются)"""
+        idle = [digest for digest in self.plans if not self._active[digest]]
+        for digest in idle[:max(len(self.plans) - self.max_plans, 0)]:
+            self.pool.release(self.plans.pop(digest))
+            del self._active[digest]
+
+    @contextmanager
+    def _running(self, plan):
+        self._active[plan.digest()] += 1
+        try:
+            yield
+        finally:
+            self._active[plan.digest()] -= 1
+            # план вытеснили, пока он считался: пул опубликовал его заново, освобождаем
+            if plan.digest() not in self.plans and not self._active[plan.digest()]:
+                self.pool.release(plan)
+                del self._active[plan.digest()]
+            self._evict()
+
+    async def simulate(self, plan, percentile, n_iter, seed, sampler="iid", progress=None):
+        """
+        Монте-Карло для одного процентиля (как monte_carlo_simulation), частями в пуле.
+
+        :param progress: вызывается как progress(done, total) после каждой части
+        :return: (durations, idle) — idle в виде словаря роль → массив
+        """
+        cache = result_cache()
+        key = cache.key(plan, percentile, n_iter, seed, sampler)
+        cached = cache.get(key)
+        if cached is not None:
+            if progress is not None:
+                progress(n_iter, n_iter)
+            return cached[0], idle_by_role(plan, cached[1])
+
+        # тот же прогон уже считается: ждём его результат
+        job = self._jobs.get(key) if key is not None else None
+        if job is None:
+            job = _Job(n_iter)
+            if key is not None:
+                self._jobs[key] = job
+            asyncio.ensure_future(self._run(job, key, plan, percentile, n_iter, seed, sampler))
+        if progress is not None:
+            job.listeners.append(progress)
+            if job.done:
+                progress(job.done, job.total)
+        try:
+            durations, idle = await asyncio.shield(job.future)
+        finally:
+            if progress is not None and progress in job.listeners:
+                job.listeners.remove(progress)
+        return durations, idle_by_role(plan, idle)
+
+    async def _run(self, job, key, plan, percentile, n_iter, seed, sampler):
+        cache = result_cache()
+        try:
+            with self._running(plan):
+                durations, idle = await self._simulate_chunks(plan, percentile, n_iter, seed, sampler, job)
+            cache.put(key, durations, idle)
+            job.future.set_result((durations, idle))
+        except Exception as e:
+            job.future.set_exception(e)
+        finally:
+            self._jobs.pop(key, None)
+
+    async def _simulate_chunks(self, plan, percentile, n_iter, seed, sampler, job):
+        """Части прогона в процессах пула; после каждой части — событие прогресса"""
+        entropy = root_seed(seed)
+        chunk_size = self.chunk_size or min(max(1, math.ceil(n_iter / (4 * self.pool.max_workers))), MAX_CHUNK_SIZE)
+        chunks = iteration_chunks(n_iter, chunk_size)
+        parts = [
+            asyncio.wrap_future(self.pool.submit(simulate_batch, plan, percentile, entropy, start, stop, sampler, n_iter))
+            for start, stop in chunks
+        ]
+        for (start, stop), part in zip(chunks, parts):
+            part.add_done_callback(lambda _, n=stop - start: job.advance(n))
+        results = await asyncio.gather(*parts)
+
+        durations = np.concatenate([part[0] for part in results])
+        idle = np.concatenate([part[1] for part in results], axis=1)
+        return durations, idle
+
+    async def schedule(self, plan, percentile, seed=None):
+        """Одно расписание в процессе пула (см. schedule_rows)"""
+        with self._running(plan):
+            return await asyncio.wrap_future(self.pool.submit(schedule_rows, plan, percentile, seed))
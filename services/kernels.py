@@ -0,0 +1,100 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # numba необязателен: без него используется путь на NumPy
+    numba = None
+
+# Numba установлен и ядра можно компилировать
+AVAILABLE = numba is not None
+_enabled = AVAILABLE
+
+def configure_kernels(enabled=True):
+    """
+    Включает или выключает скомпилированные ядра (без numba они всегда выключены),
+    например чтобы сравнить результат с путём на NumPy
+    """
+    global _enabled
+    _enabled = bool(enabled) and AVAILABLE
+
+def kernels_enabled():
+    return _enabled
+
+def _jit(fn):
+    # cache=True: скомпилированный код сохраняется на диск и не компилируется заново в каждом процессе пула
+    return numba.njit(cache=True, nogil=True)(fn) if AVAILABLE else fn
+
+@_jit
+def _planned_kernel(order, dep_offsets, dep_indices, role_ids, n_roles, duration):
+    n_tasks = len(duration)
+    start = np.zeros(n_tasks)
+    end = np.zeros(n_tasks)
+    role_ready = np.zeros(n_roles)
+    for j in order:
+        dep_end = 0.0
+        for e in range(dep_offsets[j], dep_offsets[j + 1]):
+            dep_end = max(dep_end, end[dep_indices[e]])
+        start[j] = max(dep_end, role_ready[role_ids[j]])
+        end[j] = start[j] + duration[j]
+        role_ready[role_ids[j]] = end[j]
+    return start, end
+
+@_jit
+def _schedule_kernel(order, idle_order, dep_offsets, dep_indices, role_ids, n_roles, planned_start, real_duration):
+    n_tasks, n_iter = real_duration.shape
+    real_start = np.empty((n_tasks, n_iter))
+    real_end = np.empty((n_tasks, n_iter))
+    role_ready = np.zeros((n_roles, n_iter))
+
+    # прямой проход: задача за задачей, внутри — по всем итерациям
+    for j in order:
+        r = role_ids[j]
+        for it in range(n_iter):
+            start = max(role_ready[r, it], planned_start[j])
+            for e in range(dep_offsets[j], dep_offsets[j + 1]):
+                start = max(start, real_end[dep_indices[e], it])
+            real_start[j, it] = start
+            real_end[j, it] = start + real_duration[j, it]
+            role_ready[r, it] = real_end[j, it]
+
+    # простой: задержка из-за последнего завершившегося предшественника другой роли
+    idle = np.zeros((n_roles, n_iter))
+    for j in idle_order:
+        r = role_ids[j]
+        first = dep_offsets[j]
+        for it in range(n_iter):
+            delay = real_start[j, it] - planned_start[j]
+            if delay <= 0:
+                continue
+            latest = dep_indices[first]
+            for e in range(first + 1, dep_offsets[j + 1]):
+                if real_end[dep_indices[e], it] > real_end[latest, it]:
+                    latest = dep_indices[e]
+            if role_ids[latest] != r:
+                idle[r, it] += delay
+    return real_start, real_end, idle
+
+def idle_order(plan):
+    """
+    Задачи с предшественниками в порядке сложения простоя у пути на NumPy
+    (по числу предшественников, затем по индексу) — так суммы совпадают до бита
+    """
+    counts = np.diff(plan.dep_offsets)
+    tasks = np.flatnonzero(counts)
+    return tasks[np.argsort(counts[tasks], kind="stable")].astype(np.intp)
+
+def planned_schedule(plan, duration):
+    """Плановые начала и концы задач одним скомпилированным циклом"""
+    return _planned_kernel(plan.order, plan.dep_offsets, plan.dep_indices, plan.role_ids,
+                           plan.n_roles, np.ascontiguousarray(duration, dtype=float))
+
+def simulate_schedule(plan, planned_start, real_duration):
+    """
+    Фактическое расписание и простой по ролям для всех итераций одним скомпилированным циклом.
+    Результат совпадает с forward_pass и idle_time_matrix из services.simulation.
+
+    :return: (real_start, real_end, idle) — idle в форме (n_roles, n_iter)
+    """
+    return _schedule_kernel(plan.order, idle_order(plan), plan.dep_offsets, plan.dep_indices,
+                            plan.role_ids, plan.n_roles, np.ascontiguousarray(planned_start, dtype=float),
+                            np.ascontiguousarray(real_duration, dtype=float))
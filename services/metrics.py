@@ -1,10 +1,16 @@
 from concurrent import futures
 from collections import defaultdict
+import math
 import numpy as np
-from services.parser import load_tasks_from_csv
-from services.scheduler import build_schedule
-from tqdm import tqdm
-import copy
+from scipy.special import ndtri
+from services.accumulators import SimulationSummary
+from services.cache import result_cache
+from services.pool import using_pool
+from services.profiling import profiled
+from services.run_store import run_store
+from services.scheduler import build_schedule, compile_plan
+from services.sampling import root_seed
+from services.simulation import simulate_batch, simulate_summary, simulate_criticality, idle_by_role
 
 def calculate_idle_time_old(tasks):
     """
@@ -30,6 +36,7 @@ def calculate_idle_time_old(tasks):
 
     return role_idle_time
 
+@profiled("metrics.calculate_idle_time")
 def calculate_idle_time(tasks):
     """
     Возвращает словарь: роль → суммарный простой (в человеко-днях).
@@ -69,64 +76,373 @@ def calculate_project_duration(tasks):
     return max(task.real_start_time + task.real_duration for task in tasks)
 
 
-def monte_carlo_simulation(task_file, percentile, n_iter, seed):
+@profiled("metrics.monte_carlo_simulation", iterations="n_iter")
+def monte_carlo_simulation(task_file, percentile, n_iter, seed, use_cache=True, streaming=False, bin_width=0.01, sampler="iid"):
     """
     Выполняет n_iter симуляций для заданного процентиля
     Возвращает массив из длительностей рассчитанных проектов
+    и словарь роль → массив простоя по итерациям
+
+    :param task_file: путь к CSV с задачами или CompiledPlan
+    :param seed: зерно; у каждой итерации свой поток numpy.random.Generator
+    :param use_cache: брать повторные прогоны (тот же план, процентиль, n_iter и seed) из кэша;
+                      если включено хранилище прогонов, недостающие итерации дописываются к сохранённым
+    :param streaming: вместо массивов вернуть SimulationSummary (память не зависит от n_iter)
+    :param bin_width: ширина корзины гистограммы длительностей в потоковом режиме
+    :param sampler: стратегия выборки длительностей: "iid", "antithetic", "lhs" или "sobol"
+                    (см. services.sampling.sample_real_durations)
     """
-    rng = np.random.default_rng(seed)
+    # Загружаем и компилируем план один раз
+    plan = compile_plan(task_file)
+
+    if streaming:
+        return simulate_summary(plan, percentile, root_seed(seed), 0, n_iter, bin_width, sampler=sampler, n_iter=n_iter)
 
-    # Загружаем задачи один раз
-    base_tasks = load_tasks_from_csv(task_file)
+    cache = result_cache()
+    key = cache.key(plan, percentile, n_iter, seed, sampler) if use_cache else None
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0], idle_by_role(plan, cached[1])
 
-    # Предгенерация seed-ов для итераций
-    seeds = rng.integers(1_000_000, size=n_iter)
+    # Сохранённые итерации берутся из хранилища, остальные считаются пакетно (см. services.simulation)
+    stored = _stored_iterations(plan, percentile, n_iter, seed, sampler, use_cache)
+    start = len(stored[0])
+    if start < n_iter:
+        new = simulate_batch(plan, percentile, root_seed(seed), start, n_iter, sampler, n_iter)
+        _store_iterations(plan, percentile, seed, sampler, start, *new, source=task_file)
+        stored = np.concatenate([stored[0], new[0]]), np.concatenate([stored[1], new[1]], axis=1)
+    durations, idle = stored
+    cache.put(key, durations, idle)
+    return durations, idle_by_role(plan, idle)
 
-    durations = np.empty(n_iter, dtype=float)   # быстрее чем list
-    idle_records = []
+def _stored_iterations(plan, percentile, n_iter, seed, sampler, use_cache=True):
+    """
+    Первые (до n_iter) итерации прогона из хранилища прогонов или пустые массивы.
+    Выборки "lhs" зависят от длины прогона, поэтому их итерации не продолжаются и не сохраняются
+    """
+    store = run_store()
+    if store is None or not use_cache or seed is None or sampler == "lhs":
+        return np.empty(0), np.empty((plan.n_roles, 0))
+    return store.load(plan, percentile, seed, sampler, n_iter)
+
+def _store_iterations(plan, percentile, seed, sampler, start, durations, idle, source=None):
+    """Дописывает посчитанные итерации [start, ...) к прогону в хранилище, если оно включено"""
+    store = run_store()
+    if store is not None and seed is not None and sampler != "lhs":
+        source = source if isinstance(source, str) else None
+        store.append(plan, percentile, seed, sampler, start, durations, idle, source)
+
+def iteration_chunks(n_iter, chunk_size, start=0):
+    """
+    Разбивает итерации [start, n_iter) на отрезки [a, b) длиной не больше chunk_size
+    """
+    return [(a, min(a + chunk_size, n_iter)) for a in range(start, n_iter, chunk_size)]
 
-    for i, sim_seed in enumerate(tqdm(seeds, desc=f"Процентиль {percentile}", leave=False)):
-        # Копируем задачи (без повторного чтения файла)
-        for task in base_tasks:
-            task.reset()
+@profiled("metrics.parallel_monte_carlo_simulation", iterations="n_iter")
+def parallel_monte_carlo_simulation(task_file, percentiles, n_iter, seed, chunk_size=None, max_workers=None, pool=None, use_cache=True, streaming=False, bin_width=0.01, sampler="iid"):
+    """
+    Параллельный Монте-Карло по нескольким процентилям.
+    Работа делится на части (процентиль, отрезок итераций), поэтому загружены
+    все ядра даже при небольшом числе процентилей. У каждой итерации свой поток
+    случайных чисел, так что результат не зависит от chunk_size и числа процессов.
 
-        # Строим расписание
-        build_schedule(base_tasks, percentile=percentile, seed=sim_seed)
+    :param chunk_size: итераций в одной части (по умолчанию — примерно 4 части на процесс)
+    :param max_workers: число процессов (по умолчанию — число ядер), если пул не передан
+    :param pool: общий SimulationPool; без него создаётся временный пул
+    :param use_cache: брать уже посчитанные процентили из кэша результатов
+                      и сохранённые итерации из хранилища прогонов (services.run_store)
+    :param streaming: процессы возвращают SimulationSummary, которые объединяются по процентилю
+    :param bin_width: ширина корзины гистограммы длительностей в потоковом режиме
+    :param sampler: стратегия выборки длительностей (как в monte_carlo_simulation)
+    :return: словарь процентиль → (durations, idle) как у monte_carlo_simulation
+             или процентиль → SimulationSummary в потоковом режиме; при n_iter=0 — пустые
+    """
+    if n_iter < 0:
+        raise ValueError(f"Число итераций не может быть отрицательным: {n_iter}")
+    results = {}
+    # план компилируется один раз и передаётся в процессы через общую память
+    plan = compile_plan(task_file)
 
-        # Длительность проекта = max(real_end_time)
-        duration = max(t.real_end_time for t in base_tasks)
+    # повторные прогоны отдаются из кэша (только при заданном seed)
+    cache = result_cache()
+    use_cache = use_cache and not streaming
+    keys = {p: cache.key(plan, p, n_iter, seed, sampler) if use_cache else None for p in percentiles}
+    for p in percentiles:
+        cached = cache.get(keys[p])
+        if cached is not None:
+            results[p] = cached[0], idle_by_role(plan, cached[1])
+    missing = [p for p in percentiles if p not in results]
+    if not missing:
+        return results
 
-        # Простой по ролям
-        idle = calculate_idle_time(base_tasks)
+    # итерации, уже сохранённые в хранилище прогонов, не пересчитываются
+    stored = {} if streaming else {p: _stored_iterations(plan, p, n_iter, seed, sampler, use_cache) for p in missing}
+    first = {p: len(stored[p][0]) if p in stored else 0 for p in missing}
+    for p in [p for p in missing if p in stored and first[p] == n_iter]:
+        cache.put(keys[p], *stored[p])
+        results[p] = stored[p][0], idle_by_role(plan, stored[p][1])
+    missing = [p for p in missing if p not in results]
+    if not missing:
+        return {p: results[p] for p in percentiles}
+    store_seed = seed
 
-        durations[i] = duration
-        idle_records.append(idle)
+    # при seed=None энтропия выбирается здесь, чтобы процессы не выбирали её независимо
+    seed = root_seed(seed)
 
-    return durations, idle_records
+    errors = {}
+    with using_pool(pool, max_workers) as pool:
+        if chunk_size is None:
+            remaining = sum(n_iter - first[p] for p in missing)
+            chunk_size = max(1, math.ceil(remaining / (4 * pool.max_workers)))
+        chunks = {p: iteration_chunks(n_iter, chunk_size, first[p]) for p in missing}
+        parts = {p: [None] * len(chunks[p]) for p in missing}
 
-def parallel_monte_carlo_simulation(task_file, percentiles, n_iter, seed):
-    results = {}
-    with futures.ProcessPoolExecutor() as executor:
-        # отправляем задачи и запоминаем, какому p соответствует future
-        future_to_p = {
-            executor.submit(monte_carlo_simulation, task_file, p, n_iter, seed): p
-            for p in percentiles
-        }
+        # отправляем части и запоминаем, какому (p, номер отрезка) соответствует future
+        if streaming:
+            future_to_part = {
+                pool.submit(simulate_summary, plan, p, seed, start, stop, bin_width, sampler=sampler, n_iter=n_iter): (p, k)
+                for p in missing
+                for k, (start, stop) in enumerate(chunks[p])
+            }
+        else:
+            future_to_part = {
+                pool.submit(simulate_batch, plan, p, seed, start, stop, sampler, n_iter): (p, k)
+                for p in missing
+                for k, (start, stop) in enumerate(chunks[p])
+            }
 
         # ждём выполнения
-        for future in futures.as_completed(future_to_p):
-            p = future_to_p[future]
+        for future in futures.as_completed(future_to_part):
+            p, k = future_to_part[future]
             try:
-                results[p] = future.result()
+                parts[p][k] = future.result()
             except Exception as e:
-                results[p] = e  # чтобы не терять ошибки
+                errors[p] = e  # чтобы не терять ошибки
+
+    # склеиваем отрезки по порядку итераций
+    for p in missing:
+        if p in errors:
+            results[p] = errors[p]
+            continue
+        if streaming:
+            summary = parts[p][0] if parts[p] else SimulationSummary(plan.roles, bin_width)
+            for part in parts[p][1:]:
+                summary.merge(part)
+            results[p] = summary
+            continue
+        new_durations = np.concatenate([part[0] for part in parts[p]])
+        new_idle = np.concatenate([part[1] for part in parts[p]], axis=1)
+        _store_iterations(plan, p, store_seed, sampler, first[p], new_durations, new_idle, task_file)
+        durations = np.concatenate([stored[p][0], new_durations])
+        idle = np.concatenate([stored[p][1], new_idle], axis=1)
+        cache.put(keys[p], durations, idle)
+        results[p] = durations, idle_by_role(plan, idle)
+    return {p: results[p] for p in percentiles}
+
+@profiled("metrics.criticality_analysis", iterations="n_iter")
+def criticality_analysis(task_file, percentile, n_iter, seed, sampler="iid", chunk_size=None, max_workers=None, pool=None):
+    """
+    Индекс критичности задач и вклад ролей в перерасход срока.
+    Критические цепочки отслеживаются в прямом проходе симуляции, итерации
+    делятся на части между процессами пула, как в parallel_monte_carlo_simulation.
+
+    :return: CriticalityAccumulator: criticality() — доля итераций, в которых задача
+             лежала на критической цепочке; mean_role_overrun() — средний вклад роли в перерасход
+    """
+    plan = compile_plan(task_file)
+    seed = root_seed(seed)
+
+    with using_pool(pool, max_workers) as pool:
+        if chunk_size is None:
+            chunk_size = max(1, math.ceil(n_iter / (4 * pool.max_workers)))
+        parts = [
+            pool.submit(simulate_criticality, plan, percentile, seed, start, stop, sampler, n_iter)
+            for start, stop in iteration_chunks(n_iter, chunk_size)
+        ]
+        result = parts[0].result()
+        for part in parts[1:]:
+            result.merge(part.result())
+    return result
+
+def target_estimate(durations, target="mean"):
+    """
+    Оценка целевой статистики: среднего ("mean") или процентиля (0–100, как percentile_project)
+    """
+    if target == "mean":
+        return float(np.mean(durations))
+    return float(np.percentile(durations, target))
+
+def confidence_half_width(durations, target="mean", confidence=0.95):
+    """
+    Полуширина доверительного интервала целевой статистики.
+    Для среднего — нормальное приближение z·s/√n, для процентиля —
+    интервал между порядковыми статистиками (биномиальное приближение, без
+    предположений о распределении)
+    """
+    n = len(durations)
+    if n < 2:
+        return np.inf
+    z = ndtri(0.5 + confidence / 2)
+    if target == "mean":
+        return float(z * np.std(durations, ddof=1) / np.sqrt(n))
+
+    q = float(target) / 100
+    spread = z * np.sqrt(n * q * (1 - q))
+    lo = int(max(np.floor(n * q - spread), 0))
+    hi = int(min(np.ceil(n * q + spread), n - 1))
+    ordered = np.partition(durations, (lo, hi))
+    return float((ordered[hi] - ordered[lo]) / 2)
+
+@profiled("metrics.parallel_adaptive_monte_carlo_simulation")
+def parallel_adaptive_monte_carlo_simulation(task_file, percentiles, seed, tolerance, target="mean",
+                                             confidence=0.95, batch_size=1000, max_iter=100_000,
+                                             chunk_size=None, max_workers=None, pool=None, sampler="iid"):
+    """
+    Адаптивный Монте-Карло: итерации добавляются пакетами по batch_size, пока
+    полуширина доверительного интервала целевой статистики не станет меньше
+    tolerance (или не будет достигнуто max_iter). Процентили, которые уже сошлись,
+    в следующих раундах не считаются.
+
+    Итерации имеют собственные потоки случайных чисел, поэтому результат
+    на n итерациях совпадает с обычным прогоном на n итерациях
+    (кроме "lhs": его страты строятся на max_iter итерациях).
+
+    :param target: "mean" — средняя длительность проекта, число — процентиль
+                   длительности (0–100, как percentile_project в calculate_buffer)
+    :param tolerance: требуемая полуширина доверительного интервала (в днях)
+    :param confidence: уровень доверия интервала
+    :param sampler: стратегия выборки длительностей (как в monte_carlo_simulation)
+    :return: словарь процентиль → (durations, idle, report), где report —
+             словарь с оценкой, достигнутой полушириной интервала и числом итераций
+    """
+    plan = compile_plan(task_file)
+    seed = root_seed(seed)
+    cache = result_cache()
+
+    durations = {p: np.empty(0) for p in percentiles}
+    idles = {p: np.empty((plan.n_roles, 0)) for p in percentiles}
+    half_widths = {p: np.inf for p in percentiles}
+    active = list(percentiles)
+
+    with using_pool(pool, max_workers) as pool:
+        while active:
+            # очередной пакет итераций для всех ещё не сошедшихся процентилей
+            future_to_part = {}
+            for p in active:
+                n = len(durations[p])
+                stop = min(n + batch_size, max_iter)
+                size = chunk_size or max(1, math.ceil((stop - n) * len(active) / (4 * pool.max_workers)))
+                for k, (start, end) in enumerate(iteration_chunks(stop - n, size)):
+                    future = pool.submit(simulate_batch, plan, p, seed, n + start, n + end, sampler, max_iter)
+                    future_to_part[future] = (p, k)
+
+            parts = {p: {} for p in active}
+            for future in futures.as_completed(future_to_part):
+                p, k = future_to_part[future]
+                parts[p][k] = future.result()
+
+            for p in active:
+                chunk_results = [parts[p][k] for k in sorted(parts[p])]
+                durations[p] = np.concatenate([durations[p]] + [part[0] for part in chunk_results])
+                idles[p] = np.concatenate([idles[p]] + [part[1] for part in chunk_results], axis=1)
+                half_widths[p] = confidence_half_width(durations[p], target, confidence)
+
+            active = [p for p in active if half_widths[p] > tolerance and len(durations[p]) < max_iter]
+
+    results = {}
+    for p in percentiles:
+        # страты "lhs" построены на max_iter итерациях: короткий прогон не равен обычному той же длины
+        if sampler != "lhs" or len(durations[p]) == max_iter:
+            cache.put(cache.key(plan, p, len(durations[p]), seed, sampler), durations[p], idles[p])
+        report = {
+            "target": target,
+            "estimate": target_estimate(durations[p], target),
+            "half_width": half_widths[p],
+            "confidence": confidence,
+            "tolerance": tolerance,
+            "n_iter": len(durations[p]),
+            "converged": half_widths[p] <= tolerance,
+        }
+        results[p] = durations[p], idle_by_role(plan, idles[p]), report
     return results
 
+@profiled("metrics.adaptive_monte_carlo_simulation")
+def adaptive_monte_carlo_simulation(task_file, percentile, seed, tolerance, target="mean",
+                                    confidence=0.95, batch_size=1000, max_iter=100_000, sampler="iid"):
+    """
+    Адаптивный вариант monte_carlo_simulation в одном процессе
+    (параметры — как у parallel_adaptive_monte_carlo_simulation).
+
+    :return: (durations, idle, report)
+    """
+    plan = compile_plan(task_file)
+    seed = root_seed(seed)
+
+    durations = np.empty(0)
+    idle = np.empty((plan.n_roles, 0))
+    half_width = np.inf
+    while half_width > tolerance and len(durations) < max_iter:
+        n = len(durations)
+        batch_durations, batch_idle = simulate_batch(plan, percentile, seed, n, min(n + batch_size, max_iter), sampler, max_iter)
+        durations = np.concatenate([durations, batch_durations])
+        idle = np.concatenate([idle, batch_idle], axis=1)
+        half_width = confidence_half_width(durations, target, confidence)
+
+    report = {
+        "target": target,
+        "estimate": target_estimate(durations, target),
+        "half_width": half_width,
+        "confidence": confidence,
+        "tolerance": tolerance,
+        "n_iter": len(durations),
+        "converged": half_width <= tolerance,
+    }
+    return durations, idle_by_role(plan, idle), report
+
 def calculate_buffer(durations, planned_duration, percentile_project):
     """
-    Расчитывает длину буфера проекта при определенном процентиле
+    Расчитывает длину буфера проекта при определенном процентиле.
+    percentile_project (0–100) может быть массивом — тогда возвращается массив буферов.
+    durations — массив длительностей или SimulationSummary потокового режима
     """
+    if isinstance(durations, SimulationSummary):
+        # перерасход max(0, d - plan) монотонен по d, поэтому его квантиль — это квантиль d
+        quantiles = durations.quantile(np.asarray(percentile_project, dtype=float) / 100)
+        return np.maximum(0, quantiles - planned_duration)
     durations = np.array(durations)
     overruns = np.maximum(0, durations - planned_duration)
-    buffer_value = np.percentile(sorted(overruns), percentile_project)
-    return buffer_value
\ No newline at end of file
+    buffer_value = np.percentile(overruns, percentile_project)
+    return buffer_value
+
+@profiled("metrics.percentile_sweep", iterations="n_iter")
+def percentile_sweep(task_file, task_percentiles, project_percentiles, n_iter, seed, pool=None):
+    """
+    Данные для тепловых карт по сетке (процентиль задач, процентиль проекта).
+    Процентиль проекта — лишь квантиль той же выборки длительностей, поэтому
+    симуляция выполняется один раз на процентиль задач, а буферы для всех
+    процентилей проекта считаются одним вызовом np.percentile.
+
+    :param task_percentiles: процентили длительностей задач (0.1 = 10%)
+    :param project_percentiles: процентили проекта (0.9 = 90%)
+    :return: (mean_durations, mean_idles, buffers) — средняя длительность и средний суммарный
+             простой по процентилям задач и матрица буферов (n_task, n_project)
+    """
+    plan = compile_plan(task_file)
+    runs = parallel_monte_carlo_simulation(plan, task_percentiles, n_iter, seed, pool=pool)
+    quantiles = np.asarray(project_percentiles, dtype=float) * 100
+
+    mean_durations = np.empty(len(task_percentiles))
+    mean_idles = np.empty(len(task_percentiles))
+    buffers = np.empty((len(task_percentiles), len(quantiles)))
+    for i, t_p in enumerate(task_percentiles):
+        if isinstance(runs[t_p], Exception):
+            raise runs[t_p]
+        durations, idles = runs[t_p]
+
+        # длительность, от которой отсчитывается буфер, — как в part1_3_project_buffer
+        reference_duration = calculate_project_duration(build_schedule(plan, t_p, seed=seed))
+
+        mean_durations[i] = np.mean(durations)
+        mean_idles[i] = np.mean(sum(idles.values())) if idles else 0.0
+        buffers[i] = calculate_buffer(durations, reference_duration, quantiles)
+    return mean_durations, mean_idles, buffers
@@ -1,21 +1,39 @@
+import numpy as np
 import pandas as pd
-from models.task import Task
+from models.task import TaskTable
+from services.profiling import profiled
 
-def load_tasks_from_csv(path):
-    df = pd.read_csv(path)
-    tasks = []
-    for _, row in df.iterrows():
-        deps = row['dependencies']
-        dependencies = deps.split(',') if pd.notna(deps) else []
-        dependencies = list(map(int, dependencies))
+COLUMNS = ("task_id", "role", "dependencies", "mean", "stddev")
+
+@profiled("parser.load_task_table")
+def load_task_table(path):
+    """
+    Загружает задачи из CSV в таблицу TaskTable без обхода строк:
+    столбец зависимостей разбирается одним вызовом для всего файла.
+    Проверяет неизвестные предшественники и циклы (ValueError)
+    """
+    df = pd.read_csv(path, dtype={"dependencies": str})
+    missing = [column for column in COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"В файле {path} нет столбцов: {missing}")
 
-        task = Task(
-            task_id=row['task_id'],
-            role=row['role'],
-            dependencies=dependencies,
-            mean=row['mean'],
-            stddev=row['stddev']
-        )
-        tasks.append(task)
-    return tasks
+    # Зависимости: строки вида "1,2,5"; пустые ячейки — задачи без предшественников
+    deps = df["dependencies"].fillna("").tolist()
+    dep_counts = np.fromiter((value.count(",") + 1 if value.strip() else 0 for value in deps),
+                             dtype=np.intp, count=len(deps))
+    joined = ",".join(value for value in deps if value.strip())
+    dep_ids = np.array(joined.split(","), dtype=np.int64) if joined else np.zeros(0, dtype=np.int64)
 
+    role_ids, roles = pd.factorize(df["role"], sort=True)
+    return TaskTable.from_ids(
+        task_ids=df["task_id"].to_numpy(dtype=np.int64),
+        roles=roles.tolist(),
+        role_ids=role_ids,
+        mean=df["mean"].to_numpy(dtype=float),
+        stddev=df["stddev"].to_numpy(dtype=float),
+        dep_counts=dep_counts,
+        dep_ids=dep_ids
+    )
+
+def load_tasks_from_csv(path):
+    return load_task_table(path).to_tasks()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# Меняется при изменении состава или смысла массивов плана, чтобы старые файлы не читались
+PLAN_FORMAT_VERSION = 1
+HEADER = "header.json"
+
+def file_sha256(path, chunk_size=2**20):
+    """SHA-256 содержимого файла"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _source_prefix(source):
+    # одноимённые CSV из разных каталогов (a/tasks.csv и b/tasks.csv) — разные планы
+    path = os.path.abspath(source)
+    path_sha = hashlib.sha256(path.encode("utf-8")).hexdigest()[:8]
+    return f"{os.path.basename(path)}-{path_sha}-"
+
+def plan_directory(cache_dir, source, source_sha):
+    """
+    Каталог скомпилированного плана. Имя содержит хэш абсолютного пути
+    и хэш содержимого исходного CSV, поэтому после правки файла задач старый
+    план не находится, а одноимённые файлы из разных каталогов не пересекаются
+    """
+    return os.path.join(cache_dir, f"{_source_prefix(source)}{source_sha[:16]}")
+
+def write_plan(directory, roles, arrays, source_sha, source=None):
+    """
+    Записывает план в каталог: по файлу .npy на массив и header.json
+    с версией формата, путём и хэшем исходного CSV, ролями, типами и формами массивов.
+    Каталог собирается во временном месте и переименовывается целиком,
+    поэтому читатели не видят недописанный план
+    """
+    tmp_directory = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(tmp_directory, exist_ok=True)
+    header = {
+        "version": PLAN_FORMAT_VERSION,
+        "source": None if source is None else os.path.abspath(source),
+        "source_sha256": source_sha,
+        "roles": list(roles),
+        "arrays": {}
+    }
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_directory, f"{name}.npy"), array)
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    with open(os.path.join(tmp_directory, HEADER), "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False, indent=2)
+
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # план уже записан другим процессом
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+def read_plan(directory, source_sha=None):
+    """
+    Открывает скомпилированный план без копирования: массивы отображаются
+    в память (np.load(mmap_mode='r')), и страницы общие для всех процессов.
+
+    :param source_sha: ожидаемый хэш исходного CSV; None — не проверять
+    :return: (roles, arrays) или None, если плана нет, он другой версии или от другого файла
+    """
+    try:
+        with open(os.path.join(directory, HEADER), encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != PLAN_FORMAT_VERSION:
+        return None
+    if source_sha is not None and header.get("source_sha256") != source_sha:
+        return None
+
+    # np.asarray снимает подкласс np.memmap (его срезы заметно медленнее), данные не копируются
+    arrays = {
+        name: np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        for name in header["arrays"]
+    }
+    return header["roles"], arrays
+
+def _header_source(directory):
+    try:
+        with open(os.path.join(directory, HEADER), encoding="utf-8") as f:
+            return json.load(f).get("source")
+    except (OSError, ValueError):
+        return None
+
+def remove_stale_plans(cache_dir, source, keep):
+    """
+    Удаляет планы того же CSV (по абсолютному пути, записанному в заголовке),
+    скомпилированные из прежних версий файла
+    """
+    prefix = _source_prefix(source)
+    source = os.path.abspath(source)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if (name.startswith(prefix) and len(name) == len(prefix) + 16 and path != keep
+                and _header_source(path) == source):
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,196 @@
+from collections import OrderedDict, deque
+from concurrent import futures
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+import os
+import tracemalloc
+import uuid
+import numpy as np
+from services.profiling import configure_profiling, stage
+from services.scheduler import CompiledPlan, load_plan_file
+
+# Планы, уже подключённые к общей памяти в процессе пула: ключ → (план, блоки памяти);
+# давно не использованные отключаются, если их больше MAX_WORKER_PLANS
+_worker_plans = OrderedDict()
+MAX_WORKER_PLANS = 32
+# Сколько последних освобождённых планов (SimulationPool.release) передаётся процессам с каждой задачей
+RELEASED_KEYS = 256
+
+class SharedPlanHandle:
+    """
+    Лёгкая ссылка на план в общей памяти: вместо массивов в процесс
+    передаются только имена блоков, типы и формы
+    """
+    def __init__(self, key, roles, blocks):
+        self.key = key
+        self.roles = roles
+        self.blocks = blocks  # имя массива → (имя блока, dtype, shape)
+
+    def attach(self):
+        """
+        Возвращает план, массивы которого смотрят в общую память (без копирования).
+        В процессе пула план подключается один раз и затем переиспользуется
+        """
+        if self.key not in _worker_plans:
+            shms = []
+            arrays = {}
+            for name, (shm_name, dtype, shape) in self.blocks.items():
+                shm = shared_memory.SharedMemory(name=shm_name)
+                shms.append(shm)
+                arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            _remember_worker_plan(self.key, CompiledPlan.from_arrays(self.roles, **arrays), shms)
+        _worker_plans.move_to_end(self.key)
+        return _worker_plans[self.key][0]
+
+class PlanFileHandle:
+    """
+    Ссылка на план, открытый из двоичного файла: процесс пула отображает
+    те же файлы в память, и страницы плана общие с главным процессом
+    """
+    def __init__(self, directory):
+        self.key = directory
+        self.directory = directory
+
+    def attach(self):
+        if self.key not in _worker_plans:
+            plan = load_plan_file(self.directory)
+            if plan is None:
+                raise FileNotFoundError(f"Скомпилированный план {self.directory} не найден или другой версии: "
+                                        "каталог планов изменён или очищен во время расчёта")
+            _remember_worker_plan(self.key, plan, [])
+        _worker_plans.move_to_end(self.key)
+        return _worker_plans[self.key][0]
+
+def _remember_worker_plan(key, plan, shms):
+    _worker_plans[key] = (plan, shms)
+    while len(_worker_plans) > MAX_WORKER_PLANS:
+        _detach(next(iter(_worker_plans)))
+
+def _detach(key):
+    """Отключает план в процессе пула; память освобождается, когда на неё не останется ссылок"""
+    _, shms = _worker_plans.pop(key, (None, []))
+    for shm in shms:
+        try:
+            shm.close()
+        except BufferError:  # массивы плана ещё используются
+            pass
+
+def _resolve(value):
+    return value.attach() if isinstance(value, (SharedPlanHandle, PlanFileHandle)) else value
+
+def _call_in_worker(fn, args, kwargs, released=()):
+    for key in released:
+        if key in _worker_plans:
+            _detach(key)
+    args = [_resolve(arg) for arg in args]
+    kwargs = {name: _resolve(value) for name, value in kwargs.items()}
+    return fn(*args, **kwargs)
+
+def _warm_up():
+    return os.getpid()
+
+def _init_worker():
+    # замеры этапов идут только в главном процессе, а tracemalloc замедлил бы процессы пула
+    configure_profiling(False)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+class SimulationPool:
+    """
+    Долгоживущий пул процессов, общий для всех этапов расчёта.
+
+    Процессы запускаются один раз при создании пула, а массивы скомпилированных
+    планов (длительности, роли, предшественники) публикуются в
+    multiprocessing.shared_memory. Аргументы CompiledPlan в submit заменяются
+    ссылками на общую память, поэтому план не сериализуется в каждую задачу
+    и CSV не перечитывается в процессах.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # трекер общей памяти запускается до процессов пула, чтобы они использовали
+        # его же, а не свои собственные (иначе блоки удаляются при выходе каждого процесса)
+        resource_tracker.ensure_running()
+        self._executor = futures.ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+        self._handles = {}
+        self._blocks = {}  # ключ плана → блоки общей памяти
+        self._released = deque(maxlen=RELEASED_KEYS)
+
+        # прогрев: все процессы стартуют сразу, а не при первом этапе
+        with stage("pool.start"):
+            warm = [self._executor.submit(_warm_up) for _ in range(self.max_workers)]
+            futures.wait(warm)
+
+    def share(self, plan):
+        """
+        Публикует массивы плана в общей памяти (один раз на план) и возвращает ссылку на них.
+        План, открытый из двоичного файла, не копируется: процессы открывают тот же файл
+        """
+        if id(plan) not in self._handles and plan.plan_file is not None:
+            self._handles[id(plan)] = (plan, PlanFileHandle(plan.plan_file))
+            if plan.plan_file in self._released:
+                self._released.remove(plan.plan_file)
+        if id(plan) not in self._handles:
+            key = uuid.uuid4().hex
+            blocks = {}
+            self._blocks[key] = []
+            for name, array in plan.arrays().items():
+                array = np.ascontiguousarray(array)
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                self._blocks[key].append(shm)
+                blocks[name] = (shm.name, array.dtype.str, array.shape)
+            # план хранится вместе со ссылкой, чтобы id(plan) не был переиспользован
+            self._handles[id(plan)] = (plan, SharedPlanHandle(key, plan.roles, blocks))
+        return self._handles[id(plan)][1]
+
+    def _pack(self, value):
+        return self.share(value) if isinstance(value, CompiledPlan) else value
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Выполняет fn(*args, **kwargs) в процессе пула. fn должна быть функцией уровня модуля;
+        аргументы-планы передаются через общую память
+        """
+        args = [self._pack(arg) for arg in args]
+        kwargs = {name: self._pack(value) for name, value in kwargs.items()}
+        return self._executor.submit(_call_in_worker, fn, args, kwargs, tuple(self._released))
+
+    def release(self, plan):
+        """
+        Освобождает опубликованный план: блоки общей памяти удаляются, а процессы пула
+        отключают план при получении следующих задач. Задачи с этим планом не должны выполняться
+        """
+        entry = self._handles.pop(id(plan), None)
+        if entry is None:
+            return
+        key = entry[1].key
+        for shm in self._blocks.pop(key, []):
+            shm.close()
+            shm.unlink()
+        self._released.append(key)
+
+    def close(self):
+        self._executor.shutdown()
+        for shms in self._blocks.values():
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+        self._blocks = {}
+        self._handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+@contextmanager
+def using_pool(pool=None, max_workers=None):
+    """
+    Отдаёт переданный пул или создаёт временный на время блока
+    """
+    if pool is not None:
+        yield pool
+        return
+    with SimulationPool(max_workers) as temporary_pool:
+        yield temporary_pool
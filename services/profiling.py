@@ -0,0 +1,191 @@
+"""
+Замеры этапов расчёта: время, число вызовов, итераций в секунду и пиковая память.
+
+Включаются переменной окружения PLANNER_PROFILE=1 или configure_profiling(True).
+Выключенные замеры почти ничего не стоят: декоратор сразу вызывает функцию.
+
+    with stage("sampling", iterations=n_iter):
+        ...
+
+    @profiled("metrics.monte_carlo", iterations="n_iter")
+    def monte_carlo_simulation(task_file, percentile, n_iter, seed): ...
+
+Сводная таблица — summary(), трасса в формате Chrome Trace Event
+(открывается в chrome://tracing и Perfetto) — write_trace(path).
+Этапы из PLANNER_CPROFILE (через запятую) дополнительно выполняются под cProfile,
+статистика сохраняется в каталог профилей (.prof, смотреть через pstats или snakeviz).
+Замеры идут только в главном процессе: работа процессов пула видна как время ожидания.
+"""
+from contextlib import contextmanager
+import cProfile
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+_enabled = os.environ.get("PLANNER_PROFILE", "") not in ("", "0")
+_cprofile_stages = {name for name in os.environ.get("PLANNER_CPROFILE", "").split(",") if name}
+_profile_dir = os.environ.get("PLANNER_PROFILE_DIR", "output/profile")
+
+_lock = threading.Lock()
+_stats = {}    # имя этапа → {"calls", "seconds", "iterations", "peak_bytes"}
+_events = []   # завершённые этапы для трассы
+_stack = threading.local()
+_origin = time.perf_counter()
+
+def configure_profiling(enabled=True, cprofile_stages=None, profile_dir=None):
+    """
+    Включает или выключает замеры.
+
+    :param cprofile_stages: имена этапов, которые выполняются под cProfile
+    :param profile_dir: каталог для .prof-файлов cProfile
+    """
+    global _enabled, _cprofile_stages, _profile_dir
+    _enabled = enabled
+    if cprofile_stages is not None:
+        _cprofile_stages = set(cprofile_stages)
+    if profile_dir is not None:
+        _profile_dir = profile_dir
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def profiling_enabled():
+    return _enabled
+
+def reset():
+    """Очищает накопленные замеры"""
+    with _lock:
+        _stats.clear()
+        _events.clear()
+
+def _frames():
+    if not hasattr(_stack, "frames"):
+        _stack.frames = []
+    return _stack.frames
+
+@contextmanager
+def stage(name, iterations=None):
+    """
+    Замеряет блок как этап name: время и пиковый прирост памяти (tracemalloc)
+    относительно начала этапа. Этапы могут быть вложенными:
+    пиковая память внешнего этапа учитывает пики вложенных
+    """
+    if not _enabled:
+        yield
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    frames = _frames()
+    # пик памяти внешнего этапа до начала этого: после reset_peak его уже не узнать
+    if frames:
+        frames[-1]["peak"] = max(frames[-1]["peak"], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    frame = {"peak": 0, "base": tracemalloc.get_traced_memory()[0]}
+    frames.append(frame)
+
+    # cProfile не допускает вложенных профилировщиков: внутри профилируемого этапа он не включается
+    nested = any(outer.get("cprofile") for outer in frames[:-1])
+    profiler = cProfile.Profile() if name in _cprofile_stages and not nested else None
+    frame["cprofile"] = profiler is not None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.perf_counter() - start
+        peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+        frames.pop()
+        if frames:
+            frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+
+        if profiler is not None:
+            os.makedirs(_profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(_profile_dir, f"{name}.prof"))
+        # прирост памяти относительно начала этапа, а не всё, что выделено процессом
+        _record(name, start, seconds, iterations, max(peak - frame["base"], 0), len(frames))
+
+def _record(name, start, seconds, iterations, peak, depth):
+    with _lock:
+        stats = _stats.setdefault(name, {"calls": 0, "seconds": 0.0, "iterations": 0, "peak_bytes": 0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["iterations"] += iterations or 0
+        stats["peak_bytes"] = max(stats["peak_bytes"], peak)
+        _events.append({
+            "name": name, "start": start - _origin, "seconds": seconds,
+            "iterations": iterations, "peak_bytes": peak, "depth": depth,
+            "thread": threading.get_ident()
+        })
+
+def profiled(name=None, iterations=None):
+    """
+    Декоратор: каждый вызов функции — этап name (по умолчанию модуль.функция).
+
+    :param iterations: имя аргумента с числом итераций (например, "n_iter")
+                       для расчёта итераций в секунду
+    """
+    def decorator(fn):
+        stage_name = name or f"{fn.__module__}.{fn.__name__}"
+        signature = inspect.signature(fn) if iterations else None
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            n_iter = None
+            if signature is not None:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                n_iter = bound.arguments.get(iterations)
+            with stage(stage_name, n_iter):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def stage_stats():
+    """Копия накопленных замеров: имя этапа → показатели"""
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+def summary():
+    """Таблица этапов по убыванию суммарного времени"""
+    rows = sorted(stage_stats().items(), key=lambda item: -item[1]["seconds"])
+    lines = [f"{'Этап':<45} {'Вызовов':>8} {'Время, с':>10} {'Итер./с':>12} {'Пик, МБ':>9}"]
+    for name, stats in rows:
+        rate = stats["iterations"] / stats["seconds"] if stats["iterations"] and stats["seconds"] > 0 else None
+        lines.append(
+            f"{name:<45} {stats['calls']:>8} {stats['seconds']:>10.3f} "
+            f"{(f'{rate:,.0f}' if rate else '-'):>12} {stats['peak_bytes'] / 2**20:>9.1f}"
+        )
+    return "\n".join(lines)
+
+def write_trace(path):
+    """
+    Записывает трассу этапов в формате Chrome Trace Event (события "X" в микросекундах)
+    и сводку по этапам в поле "stages"
+    """
+    with _lock:
+        events = list(_events)
+    trace = {
+        "traceEvents": [
+            {
+                "name": event["name"], "ph": "X", "pid": os.getpid(), "tid": event["thread"],
+                "ts": event["start"] * 1e6, "dur": event["seconds"] * 1e6,
+                "args": {"iterations": event["iterations"], "peak_mb": event["peak_bytes"] / 2**20}
+            }
+            for event in events
+        ],
+        "stages": stage_stats()
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(trace, f, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,317 @@
+"""
+Хранилище прогонов Монте-Карло на диске.
+
+Прогон адресуется так же, как в кэше результатов: хэш плана, процентиль, seed,
+стратегия выборки и версия алгоритма симуляции (CACHE_VERSION). Метаданные
+и сводная статистика (среднее, квантили длительности, простой по ролям)
+лежат в SQLite и доступны запросом без чтения выборок. Сами выборки
+хранятся частями в .npy-файлах каталога прогона:
+
+    runs.sqlite
+    <run_id>/<start>.durations.npy   — длительности итераций [start, stop)
+    <run_id>/<start>.idle.npy        — простой по ролям, форма (n_roles, stop - start)
+
+Итерации имеют собственные потоки случайных чисел, поэтому прогон можно
+дополнять: новые итерации дописываются отдельной частью, и результат
+совпадает с прогоном, посчитанным сразу на всё число итераций.
+"""
+from datetime import datetime
+import json
+import os
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+from services.accumulators import MomentAccumulator
+from services.cache import CACHE_VERSION
+from services.sampling import root_seed
+
+# Квантили длительности проекта, которые сохраняются в сводке прогона
+QUANTILES = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    plan_digest TEXT NOT NULL,
+    percentile REAL NOT NULL,
+    seed TEXT NOT NULL,
+    sampler TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    source TEXT,
+    n_tasks INTEGER NOT NULL,
+    roles TEXT NOT NULL,
+    n_iter INTEGER NOT NULL DEFAULT 0,
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    mean REAL,
+    std REAL,
+    min REAL,
+    max REAL,
+    UNIQUE (plan_digest, percentile, seed, sampler, version)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    PRIMARY KEY (run_id, start)
+);
+CREATE TABLE IF NOT EXISTS quantiles (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    q REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, q)
+);
+CREATE TABLE IF NOT EXISTS role_idle (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    mean REAL NOT NULL,
+    std REAL NOT NULL,
+    PRIMARY KEY (run_id, role)
+);
+CREATE INDEX IF NOT EXISTS runs_by_plan ON runs (plan_digest, percentile);
+"""
+
+def _percentile_key(percentile):
+    # как в ключе кэша: 0.3 и 0.30000000000000004 (np.arange) — один прогон
+    return float(f"{float(percentile):.12g}")
+
+class RunStore:
+    """
+    Прогоны Монте-Карло в каталоге directory: метаданные и сводки в SQLite,
+    выборки — частями в .npy
+    """
+    def __init__(self, directory, max_runs=None):
+        """
+        :param max_runs: сколько прогонов хранить; при появлении новых удаляются
+                         давно не дополнявшиеся (None — хранить все)
+        """
+        self.directory = directory
+        self.max_runs = max_runs
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "runs.sqlite"))
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(SCHEMA)
+        if max_runs is not None:
+            self.prune(max_runs)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def find(self, plan, percentile, seed, sampler="iid"):
+        """id прогона и число сохранённых итераций или (None, 0)"""
+        if seed is None:
+            return None, 0
+        row = self._db.execute(
+            "SELECT id, n_iter FROM runs WHERE plan_digest = ? AND percentile = ? AND seed = ? "
+            "AND sampler = ? AND version = ?",
+            (plan.digest(), _percentile_key(percentile), str(root_seed(seed)), sampler, CACHE_VERSION)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def load(self, plan, percentile, seed, sampler="iid", n_iter=None):
+        """
+        Сохранённые итерации прогона — не больше n_iter первых.
+
+        :return: (durations, idle) — idle в форме (n_roles, n); пустые массивы, если прогона нет
+        """
+        run_id, _ = self.find(plan, percentile, seed, sampler)
+        if run_id is None:
+            return np.empty(0), np.empty((plan.n_roles, 0))
+        return self.samples(run_id, n_iter)
+
+    def samples(self, run_id, n_iter=None):
+        """Выборки прогона по id: (durations, idle), не больше n_iter первых итераций"""
+        chunks = self._db.execute(
+            "SELECT start, stop FROM chunks WHERE run_id = ? ORDER BY start", (run_id,)
+        ).fetchall()
+        n_roles = len(json.loads(self._db.execute("SELECT roles FROM runs WHERE id = ?", (run_id,)).fetchone()[0]))
+        durations, idle = [np.empty(0)], [np.empty((n_roles, 0))]
+        for start, stop in chunks:
+            if n_iter is not None and start >= n_iter:
+                break
+            take = stop - start if n_iter is None else min(stop, n_iter) - start
+            base = self._chunk_path(run_id, start)
+            durations.append(np.load(f"{base}.durations.npy", mmap_mode="r")[:take])
+            idle.append(np.load(f"{base}.idle.npy", mmap_mode="r")[:, :take])
+        return np.concatenate(durations), np.concatenate(idle, axis=1)
+
+    def append(self, plan, percentile, seed, sampler, start, durations, idle, source=None):
+        """
+        Дописывает итерации [start, start + len(durations)) к прогону (создаёт его при необходимости)
+        и дополняет сводку (см. _summarize). Итерации, которые уже сохранены, пропускаются: у каждой итерации
+        свой поток случайных чисел, и повторный расчёт даёт те же значения.
+        Пропуск между сохранёнными и новыми итерациями — ошибка (ValueError).
+
+        :return: id прогона
+        """
+        if seed is None:
+            raise ValueError("Прогоны без seed не сохраняются: их нельзя ни повторить, ни дополнить")
+        durations = np.asarray(durations, dtype=float)
+        idle = np.asarray(idle, dtype=float).reshape(plan.n_roles, len(durations))
+        run_id, n_iter = self.find(plan, percentile, seed, sampler)
+        if start > n_iter:
+            raise ValueError(f"Прогон содержит {n_iter} итераций, дописывать с {start} нельзя")
+        durations, idle = durations[n_iter - start:], idle[:, n_iter - start:]
+        start = n_iter
+        if len(durations) == 0:
+            return run_id
+
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._db:
+            if run_id is None:
+                run_id = self._db.execute(
+                    "INSERT INTO runs (plan_digest, percentile, seed, sampler, version, source, n_tasks, roles, "
+                    "created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (plan.digest(), _percentile_key(percentile), str(root_seed(seed)), sampler, CACHE_VERSION,
+                     source, plan.n_tasks, json.dumps(list(plan.roles), ensure_ascii=False), now, now)
+                ).lastrowid
+
+            base = self._chunk_path(run_id, start)
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            np.save(f"{base}.durations.npy", durations)
+            np.save(f"{base}.idle.npy", idle)
+            stop = start + len(durations)
+            self._summarize(run_id, plan.roles, n_iter, durations, idle)
+            self._db.execute("INSERT INTO chunks (run_id, start, stop) VALUES (?, ?, ?)", (run_id, start, stop))
+            self._db.execute("UPDATE runs SET n_iter = ?, updated = ? WHERE id = ?", (stop, now, run_id))
+        if self.max_runs is not None:
+            self.prune(self.max_runs, keep=run_id)
+        return run_id
+
+    def prune(self, max_runs, keep=None):
+        """
+        Оставляет не больше max_runs прогонов: удаляются давно не дополнявшиеся.
+
+        :param keep: id прогона, который не удаляется (только что дописанный)
+        :return: id удалённых прогонов
+        """
+        stale = [run_id for run_id, in self._db.execute(
+            "SELECT id FROM runs WHERE id != ? ORDER BY updated DESC, id DESC LIMIT -1 OFFSET ?",
+            (-1 if keep is None else keep, max(max_runs - (keep is not None), 0))
+        ).fetchall()]
+        for run_id in stale:
+            self.delete(run_id)
+        return stale
+
+    @staticmethod
+    def _stored_moments(n, mean, std, ddof):
+        """MomentAccumulator по сохранённым n, среднему и отклонению (с поправкой ddof)"""
+        moments = MomentAccumulator()
+        if n:
+            moments.count, moments.mean, moments.m2 = n, mean, std ** 2 * (n - ddof)
+        return moments
+
+    def _summarize(self, run_id, roles, n_stored, durations, idle):
+        """
+        Дополняет сводку прогона новой частью: моменты длительности и простоя
+        объединяются с сохранёнными (MomentAccumulator), заново по всем итерациям
+        считаются только квантили — по одним длительностям, без матриц простоя
+        """
+        mean, std, lo, hi = self._db.execute(
+            "SELECT mean, std, min, max FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        moments = self._stored_moments(n_stored, mean, std, ddof=1)
+        if n_stored:
+            moments.min, moments.max = lo, hi
+        moments.update(durations)
+        self._db.execute(
+            "UPDATE runs SET mean = ?, std = ?, min = ?, max = ? WHERE id = ?",
+            (moments.mean, float(moments.std), moments.min, moments.max, run_id)
+        )
+
+        values = np.quantile(np.concatenate([self.durations(run_id), durations]), QUANTILES)
+        self._db.executemany(
+            "INSERT OR REPLACE INTO quantiles (run_id, q, value) VALUES (?, ?, ?)",
+            [(run_id, q, float(value)) for q, value in zip(QUANTILES, values)]
+        )
+
+        stored_idle = {
+            role: (mean, std) for role, mean, std in
+            self._db.execute("SELECT role, mean, std FROM role_idle WHERE run_id = ?", (run_id,))
+        }
+        rows = []
+        for k, role in enumerate(roles):
+            moments = self._stored_moments(n_stored, *stored_idle.get(role, (0.0, 0.0)), ddof=0)
+            moments.update(idle[k])
+            rows.append((run_id, role, moments.mean, float(np.sqrt(moments.m2 / moments.count))))
+        self._db.executemany("INSERT OR REPLACE INTO role_idle (run_id, role, mean, std) VALUES (?, ?, ?, ?)", rows)
+
+    def durations(self, run_id):
+        """Все сохранённые длительности прогона без матриц простоя"""
+        chunks = self._db.execute("SELECT start FROM chunks WHERE run_id = ? ORDER BY start", (run_id,)).fetchall()
+        return np.concatenate([np.empty(0)] + [
+            np.load(f"{self._chunk_path(run_id, start)}.durations.npy", mmap_mode="r") for start, in chunks
+        ])
+
+    def summaries(self, plan=None, percentile=None, sampler=None):
+        """
+        Сводки прогонов без чтения выборок: по строке на прогон, квантили
+        в столбцах q0.05…q0.99, средний простой ролей — в столбцах «Простой_<роль>».
+
+        :param plan: CompiledPlan или хэш плана — только прогоны этого плана
+        :param percentile: только прогоны этого процентиля задач
+        :param sampler: только прогоны с этой стратегией выборки
+        :return: DataFrame
+        """
+        conditions, params = [], []
+        if plan is not None:
+            conditions.append("plan_digest = ?")
+            params.append(plan if isinstance(plan, str) else plan.digest())
+        if percentile is not None:
+            conditions.append("percentile = ?")
+            params.append(_percentile_key(percentile))
+        if sampler is not None:
+            conditions.append("sampler = ?")
+            params.append(sampler)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        runs = pd.read_sql_query(
+            "SELECT id, plan_digest, source, percentile, seed, sampler, version, n_tasks, n_iter, "
+            f"created, updated, mean, std, min, max FROM runs {where} ORDER BY id",
+            self._db, params=params
+        ).set_index("id")
+        if runs.empty:
+            return runs
+
+        ids = ",".join(str(run_id) for run_id in runs.index)
+        quantiles = pd.read_sql_query(f"SELECT run_id, q, value FROM quantiles WHERE run_id IN ({ids})", self._db)
+        quantiles = quantiles.pivot(index="run_id", columns="q", values="value")
+        quantiles.columns = [f"q{q:g}" for q in quantiles.columns]
+        idle = pd.read_sql_query(f"SELECT run_id, role, mean FROM role_idle WHERE run_id IN ({ids})", self._db)
+        idle = idle.pivot(index="run_id", columns="role", values="mean")
+        idle.columns = [f"Простой_{role}" for role in idle.columns]
+        return runs.join(quantiles).join(idle)
+
+    def delete(self, run_id):
+        """Удаляет прогон вместе с его выборками"""
+        with self._db:
+            self._db.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+        shutil.rmtree(os.path.join(self.directory, str(run_id)), ignore_errors=True)
+
+    def _chunk_path(self, run_id, start):
+        return os.path.join(self.directory, str(run_id), f"{start:012d}")
+
+# Хранилище процесса; по умолчанию выключено, включается через configure_run_store
+_run_store = None
+
+def run_store():
+    return _run_store
+
+def configure_run_store(directory, max_runs=None):
+    """
+    Включает хранилище прогонов в каталоге directory (None — выключает).
+    Монте-Карло с заданным seed тогда сохраняет прогоны и дописывает к ним недостающие итерации
+
+    :param max_runs: сколько прогонов хранить (см. RunStore)
+    """
+    global _run_store
+    if _run_store is not None:
+        _run_store.close()
+    _run_store = RunStore(directory, max_runs) if directory is not None else None
+    return _run_store
@@ -0,0 +1,158 @@
+import warnings
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+# Раунды сети Фейстеля, переставляющей страты латинского гиперкуба
+_FEISTEL_ROUNDS = 4
+
+# Ключи потоков стратегий: отличаются от ключей итераций (i,) длиной spawn_key
+_STRATEGY_KEYS = {"lhs": 1, "sobol": 2}
+_EPS = np.finfo(float).eps
+
+def root_seed(seed):
+    """
+    Приводит seed к энтропии корневого SeedSequence.
+    При seed=None энтропия берётся из ОС — её нужно получить один раз
+    в главном процессе и передавать дальше, чтобы все части прогона
+    использовали одни и те же потоки случайных чисел
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed.entropy
+    return np.random.SeedSequence(seed).entropy
+
+def iteration_rng(seed, i):
+    """
+    Генератор итерации i — i-й потомок SeedSequence(seed).
+    Поток зависит только от seed и номера итерации, поэтому результат
+    не зависит от того, как итерации разбиты между процессами
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(i,)))
+
+def _iid_normals(seed, start, stop, n_tasks, n_iter):
+    """
+    Независимые выборки: у каждой итерации свой поток и один векторный вызов по всем задачам
+    """
+    normals = np.empty((stop - start, n_tasks))
+    for k, i in enumerate(range(start, stop)):
+        normals[k] = iteration_rng(seed, i).standard_normal(n_tasks)
+    return normals
+
+def _antithetic_normals(seed, start, stop, n_tasks, n_iter):
+    """
+    Итерации 2k и 2k+1 — пара z и -z из потока k
+    """
+    normals = np.empty((stop - start, n_tasks))
+    for k, i in enumerate(range(start, stop)):
+        if i % 2 and k:
+            normals[k] = -normals[k - 1]
+        else:
+            z = iteration_rng(seed, i // 2).standard_normal(n_tasks)
+            normals[k] = -z if i % 2 else z
+    return normals
+
+def _mix(values):
+    """Перемешивание битов uint64 (финализатор splitmix64)"""
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(31)
+    values *= np.uint64(0x94D049BB133111EB)
+    values ^= values >> np.uint64(29)
+    return values
+
+def _feistel(values, keys, half_bits):
+    """
+    Сеть Фейстеля на 2 * half_bits битах — биекция [0, 4 ** half_bits) на себя.
+
+    :param keys: ключи раундов (_FEISTEL_ROUNDS, ...), совместимые по форме с values
+    """
+    shift, mask = np.uint64(half_bits), np.uint64((1 << half_bits) - 1)
+    for key in keys:
+        left, right = values >> shift, values & mask
+        values = (right << shift) | (left ^ (_mix(right ^ key) & mask))
+    return values
+
+def _lhs_strata(seed, start, stop, n_tasks, n_iter):
+    """
+    Страты итераций [start, stop) латинского гиперкуба на n_iter итерациях:
+    для каждой задачи своя случайная перестановка [0, n_iter). Перестановка
+    вычисляется поэлементно (сеть Фейстеля с обходом цикла до значения < n_iter),
+    поэтому часть прогона строит только свои строки, а не весь план
+
+    :return: матрица (stop - start, n_tasks) номеров страт
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(_STRATEGY_KEYS["lhs"], 1)))
+    keys = rng.integers(0, 2**64, size=(_FEISTEL_ROUNDS, n_tasks), dtype=np.uint64, endpoint=False)
+    half_bits = max(1, ((n_iter - 1).bit_length() + 1) // 2)
+
+    rows = np.arange(start, stop, dtype=np.uint64)[:, None]
+    strata = _feistel(np.broadcast_to(rows, (stop - start, n_tasks)), keys[:, None, :], half_bits)
+    pending = np.nonzero(strata >= n_iter)
+    while len(pending[0]):
+        strata[pending] = _feistel(strata[pending], keys[:, pending[1]], half_bits)
+        pending = tuple(axis[strata[pending] >= n_iter] for axis in pending)
+    return strata.astype(np.int64)
+
+def _lhs_uniforms(seed, start, stop, n_tasks, n_iter):
+    """
+    Латинский гиперкуб на всём прогоне [0, n_iter): у каждой задачи каждая из n_iter
+    равных страт (0, 1) получает ровно одну итерацию, положение внутри страты — из потока
+    итерации. Строки зависят только от seed, номера итерации и n_iter, а не от разбиения на части
+    """
+    strata = _lhs_strata(seed, start, stop, n_tasks, n_iter)
+    offsets = np.empty((stop - start, n_tasks))
+    for k, i in enumerate(range(start, stop)):
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(_STRATEGY_KEYS["lhs"], 0, i)))
+        offsets[k] = rng.random(n_tasks)
+    return (strata + offsets) / n_iter
+
+def _lhs_normals(seed, start, stop, n_tasks, n_iter):
+    # точки на границах куба дали бы бесконечные длительности
+    return ndtri(np.clip(_lhs_uniforms(seed, start, stop, n_tasks, n_iter), _EPS, 1 - _EPS))
+
+def _sobol_normals(seed, start, stop, n_tasks, n_iter):
+    """
+    Скремблированная последовательность Соболя: точки start..stop одной
+    последовательности (fast_forward), так что части прогона её не пересекают
+    """
+    if n_tasks > qmc.Sobol.MAXDIM:
+        raise ValueError(f"Соболь поддерживает не более {qmc.Sobol.MAXDIM} задач, в плане {n_tasks}")
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(_STRATEGY_KEYS["sobol"],)))
+    engine = qmc.Sobol(d=n_tasks, scramble=True, seed=rng)
+    if start:
+        engine.fast_forward(start)
+    with warnings.catch_warnings():
+        # баланс точек гарантирован для степеней двойки; на части прогона это не требуется
+        warnings.simplefilter("ignore", UserWarning)
+        points = engine.random(stop - start)
+    # точки на границах куба дали бы бесконечные длительности
+    return ndtri(np.clip(points, _EPS, 1 - _EPS))
+
+# Стратегии выборки: функция возвращает стандартные нормальные величины (n_iter, n_tasks)
+SAMPLERS = {
+    "iid": _iid_normals,
+    "antithetic": _antithetic_normals,
+    "lhs": _lhs_normals,
+    "sobol": _sobol_normals,
+}
+
+def sample_real_durations(plan, seed, start, stop, sampler="iid", n_iter=None):
+    """
+    Фактические длительности задач для итераций [start, stop) прогона из n_iter итераций.
+
+    :param sampler: стратегия выборки —
+        "iid" — независимые выборки;
+        "antithetic" — антитетические пары (z, -z) соседних итераций;
+        "lhs" — латинский гиперкуб на всех n_iter итерациях прогона;
+        "sobol" — скремблированная последовательность Соболя (scipy.stats.qmc).
+        Нормальные величины переводятся в длительности через логнормальное распределение задачи
+    :param n_iter: длина прогона (по умолчанию stop); от неё зависят только выборки "lhs"
+    :return: матрица (n_tasks, stop - start): строка — задача, столбец — итерация
+    """
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Неизвестная стратегия выборки: {sampler}. Доступны: {', '.join(SAMPLERS)}")
+    n_iter = stop if n_iter is None else n_iter
+    if stop > n_iter:
+        raise ValueError(f"Итерации [{start}, {stop}) выходят за прогон из {n_iter} итераций")
+
+    normals = SAMPLERS[sampler](seed, start, stop, plan.n_tasks, n_iter)
+    return np.ascontiguousarray(np.exp(plan.mu + plan.sigma * normals).T)
@@ -1,74 +1,294 @@
-from collections import defaultdict, deque
+from functools import lru_cache
+import hashlib
+import os
 import numpy as np
+from scipy.special import ndtri
+from models.task import TaskTable, lognorm_params, schedule_matrix
+from services import kernels
+from services.kernels import kernels_enabled
+from services.parser import load_task_table
+from services.plan_file import file_sha256, plan_directory, read_plan, remove_stale_plans, write_plan
+from services.profiling import profiled
 
+class CompiledPlan:
+    """
+    Скомпилированный план проекта: строится один раз по списку задач
+    и переиспользуется во всех итерациях Монте-Карло.
+
+    Хранит:
+    - order: индексы задач в топологическом порядке
+    - dep_offsets, dep_indices: предшественники в формате CSR
+      (предшественники задачи j — dep_indices[dep_offsets[j]:dep_offsets[j + 1]])
+    - roles, role_ids: список ролей и код роли каждой задачи
+    - mean, stddev: параметры длительностей задач
+    - sigma, scale, mu: параметры логнормального распределения длительностей (mu = ln(scale))
+    """
+    ARRAYS = ("task_ids", "role_ids", "mean", "stddev", "dep_offsets", "dep_indices", "order")
+
+    def __init__(self, tasks):
+        table = TaskTable.from_tasks(tasks)
+        if any(task.pinned for task in tasks):
+            # задачи другого плана (например, плана файла из кэша compile_plan):
+            # их значения копируются, а у нового плана свои представления строк
+            table.schedule[:] = schedule_matrix(tasks)
+            self._tasks = None
+        else:
+            # отдельные задачи становятся представлениями строк таблицы плана
+            for j, task in enumerate(tasks):
+                task.bind(table.schedule, j)
+            self._tasks = tasks
+        self._init_table(table)
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        План по таблице задач (см. services.parser.load_task_table).
+        Объекты Task создаются только по запросу
+        """
+        plan = cls.__new__(cls)
+        plan._tasks = None
+        plan._init_table(table)
+        return plan
+
+    @classmethod
+    def from_arrays(cls, roles, **arrays):
+        """
+        Восстанавливает план из готовых массивов (см. ARRAYS) без повторной компиляции,
+        например из общей памяти в процессе пула. Объекты Task создаются только по запросу
+        """
+        plan = cls.__new__(cls)
+        plan._tasks = None
+        plan._table = None
+        plan._init_arrays(list(roles), **arrays)
+        return plan
+
+    def _init_table(self, table):
+        self._table = table
+        self._init_arrays(table.roles, **{name: getattr(table, name) for name in self.ARRAYS})
+
+    def _init_arrays(self, roles, **arrays):
+        self.roles = roles
+        # каталог двоичной копии плана, если план открыт из неё (см. load_plan_file)
+        self.plan_file = None
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.index = {task_id: i for i, task_id in enumerate(self.task_ids.tolist())}
+        self.sigma, self.scale = lognorm_params(self.mean, self.stddev)
+        self.mu = np.log(self.scale)
+        self._planned = {}
+        self._digest = None
+
+    def arrays(self):
+        """Словарь имя → массив для всех массивов из ARRAYS"""
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def digest(self):
+        """
+        SHA-256 содержимого плана (роли и все массивы): одинаков для планов
+        из одного и того же файла задач и меняется при любой правке задач
+        """
+        if self._digest is None:
+            h = hashlib.sha256()
+            h.update("\x1f".join(self.roles).encode("utf-8"))
+            for name in self.ARRAYS:
+                array = np.ascontiguousarray(getattr(self, name))
+                h.update(f"{name}:{array.dtype.str}:{array.shape}".encode("ascii"))
+                h.update(array.tobytes())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    @property
+    def table(self):
+        """Таблица задач плана с матрицей расписания; для плана из массивов создаётся по запросу"""
+        if self._table is None:
+            arrays = self.arrays()
+            self._table = TaskTable(roles=self.roles, **arrays)
+        return self._table
+
+    @property
+    def tasks(self):
+        """
+        Список Task — представлений строк таблицы плана;
+        для плана, восстановленного из массивов, создаётся при первом обращении
+        """
+        if self._tasks is None:
+            self._tasks = self.table.to_tasks(pinned=True)
+        return self._tasks
+
+    @property
+    def n_tasks(self):
+        return len(self.task_ids)
+
+    @property
+    def n_roles(self):
+        return len(self.roles)
+
+    def predecessors(self, j):
+        """Индексы предшественников задачи j"""
+        return self.dep_indices[self.dep_offsets[j]:self.dep_offsets[j + 1]]
+
+    def planned_schedule(self, percentile):
+        """
+        Плановое расписание для процентиля. Оно детерминировано,
+        поэтому считается один раз и запоминается
+        """
+        if percentile not in self._planned:
+            self._planned[percentile] = PlannedSchedule(self, percentile)
+        return self._planned[percentile]
+
+    def remember_planned_schedule(self, percentile, duration, start, end):
+        """Запоминает готовое плановое расписание для процентиля вместо расчёта"""
+        self._planned[percentile] = PlannedSchedule.from_arrays(percentile, duration, start, end)
+
+class PlannedSchedule:
+    """
+    Плановые длительности, начала и концы задач (массивы по индексам плана)
+    """
+    @classmethod
+    def from_arrays(cls, percentile, duration, start, end):
+        """Расписание из готовых массивов, например пересчитанных инкрементально"""
+        schedule = cls.__new__(cls)
+        schedule.percentile = percentile
+        schedule.duration, schedule.start, schedule.end = duration, start, end
+        schedule.project_end = end.max() if len(end) else 0.0
+        return schedule
+
+    def __init__(self, plan, percentile):
+        self.percentile = percentile
+        self.duration = plan.scale * np.exp(plan.sigma * ndtri(percentile))
+        if kernels_enabled():
+            self.start, self.end = kernels.planned_schedule(plan, self.duration)
+        else:
+            self.start = np.zeros(plan.n_tasks)
+            self.end = np.zeros(plan.n_tasks)
+
+            role_ready = np.zeros(plan.n_roles)
+            for j in plan.order:
+                d = plan.predecessors(j)
+                r = plan.role_ids[j]
+
+                # Плановое начало = максимум из планового конца зависимостей и плановой готовности ресурса
+                dep_end = self.end[d].max() if len(d) else 0
+                self.start[j] = max(dep_end, role_ready[r])
+                self.end[j] = self.start[j] + self.duration[j]
+                role_ready[r] = self.end[j]
+
+        self.project_end = self.end.max() if plan.n_tasks else 0.0
+
+# Каталог скомпилированных планов; None — планы не сохраняются на диск
+_plan_dir = None
+
+def configure_plan_files(directory):
+    """
+    Включает хранение скомпилированных планов в каталоге (None — выключает).
+    Повторный запуск открывает план из файлов вместо разбора CSV
+    """
+    global _plan_dir
+    _plan_dir = directory
+    _compile_csv.cache_clear()
+
+def load_plan_file(directory, source_sha=None):
+    """
+    Открывает скомпилированный план с массивами, отображёнными в память.
+    Возвращает None, если файла нет или он устарел
+    """
+    stored = read_plan(directory, source_sha)
+    if stored is None:
+        return None
+    roles, arrays = stored
+    plan = CompiledPlan.from_arrays(roles, **arrays)
+    plan.plan_file = directory
+    return plan
+
+@profiled("scheduler.compile_plan_file")
+def compile_plan_file(source, directory):
+    """
+    Шаг компиляции: разбирает CSV и записывает план в двоичном виде в directory
+    (см. services.plan_file). Если план для текущего содержимого CSV уже записан,
+    файл задач не разбирается. Возвращает план, открытый из файлов
+    """
+    source_sha = file_sha256(source)
+    path = plan_directory(directory, source, source_sha)
+    plan = load_plan_file(path, source_sha)
+    if plan is None:
+        compiled = CompiledPlan.from_table(load_task_table(source))
+        write_plan(path, compiled.roles, compiled.arrays(), source_sha, source)
+        remove_stale_plans(directory, source, keep=path)
+        plan = load_plan_file(path, source_sha)
+    return plan
+
+@lru_cache(maxsize=16)
+def _compile_csv(path, mtime_ns, size):
+    if _plan_dir is not None:
+        return compile_plan_file(path, _plan_dir)
+    return CompiledPlan.from_table(load_task_table(path))
+
+def compile_plan(source):
+    """
+    Возвращает CompiledPlan для пути к CSV, списка задач или уже готового плана.
+    План для файла запоминается, пока файл не изменится; если задан каталог
+    планов (configure_plan_files), план открывается из его двоичной копии
+    """
+    if isinstance(source, CompiledPlan):
+        return source
+    if isinstance(source, (list, tuple)):
+        return CompiledPlan(list(source))
+    path = os.path.abspath(source)
+    stat = os.stat(path)
+    return _compile_csv(path, stat.st_mtime_ns, stat.st_size)
+
+@profiled("scheduler.build_schedule")
 def build_schedule(tasks, percentile, seed=None):
-    # 1. Генерация длительностей задач
-    for task in tasks:
-        task.sample_durations(percentile, seed)
-    
-    # 2. Построение графа зависимостей
-    task_map = {t.task_id: t for t in tasks}
-    graph = defaultdict(list)
-    in_degree = defaultdict(int)
-    
-    for task in tasks:
-        for dep_id in task.dependencies:
-            graph[dep_id].append(task.task_id)
-            in_degree[task.task_id] += 1
-    
-    # 3. Топологическая сортировка (Kahn's algorithm)
-    queue = deque()
-    for task in tasks:
-        if in_degree[task.task_id] == 0:
-            queue.append(task.task_id)
-    
-    scheduled_order = []
-    while queue:
-        task_id = queue.popleft()
-        scheduled_order.append(task_id)
-        
-        for neighbor in graph[task_id]:
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
-                queue.append(neighbor)
-
-    role_planned_ready = defaultdict(float)
-    role_real_ready = defaultdict(float)
-
-    for task_id in scheduled_order:
-        task = task_map[task_id]
-
-        # === Плановое выполнение ===
-
-        # Плановое завершение всех предшественников
-        planned_dep_end = max(
-            [task_map[dep].planned_start_time + task_map[dep].planned_duration for dep in task.dependencies],
-            default=0
-        )
+    """
+    Строит плановое и фактическое расписание.
+
+    :param tasks: список задач, путь к CSV или CompiledPlan (порядок и индексы берутся из него).
+                  Задачи списка получают расписание в своих объектах; для пути и плана
+                  возвращаются новые задачи со своей таблицей, так что план из кэша
+                  и результаты прошлых вызовов не меняются
+    :param seed: зерно или numpy.random.Generator для фактических длительностей
+    """
+    plan = compile_plan(tasks)
+    in_place = isinstance(tasks, (list, tuple))
+    table = plan.table if in_place else TaskTable(roles=plan.roles, **plan.arrays())
 
-        # Плановое начало = максимум из планового конца зависимостей и плановой готовности ресурса
-        task.planned_start_time = max(planned_dep_end, role_planned_ready[task.role])
-        task.planned_end_time = task.planned_start_time + task.planned_duration
+    # 1. Плановое расписание берётся из кэша плана, фактические длительности
+    #    всех задач разыгрываются одним вызовом
+    planned = plan.planned_schedule(percentile)
+    real_duration = np.random.default_rng(seed).lognormal(plan.mu, plan.sigma)
 
-        # Обновляем, когда роль будет готова по плану
-        role_planned_ready[task.role] = task.planned_end_time
+    # 2. Фактическое выполнение в топологическом порядке
+    planned_start = planned.start.tolist()
+    duration = real_duration.tolist()
+    dep_offsets = plan.dep_offsets.tolist()
+    dep_indices = plan.dep_indices.tolist()
+    role_ids = plan.role_ids.tolist()
+    real_start = [0.0] * plan.n_tasks
+    real_end = [0.0] * plan.n_tasks
+    role_real_ready = [0.0] * plan.n_roles
 
-        # === Фактическое выполнение ===
+    for j in plan.order.tolist():
+        role = role_ids[j]
 
         # Фактическое завершение всех предшественников
         real_dep_end = max(
-            [task_map[dep].real_end_time for dep in task.dependencies],
+            [real_end[i] for i in dep_indices[dep_offsets[j]:dep_offsets[j + 1]]],
             default=0
         )
 
-        # Реальная готовность роли
-        resource_ready = role_real_ready[task.role]
-
         # Фактическое начало = макс(плановое начало, конец предшественников, доступность ресурса)
-        task.real_start_time = max(task.planned_start_time, real_dep_end, resource_ready)
-        task.real_end_time = task.real_start_time + task.real_duration
+        real_start[j] = max(planned_start[j], real_dep_end, role_real_ready[role])
+        real_end[j] = real_start[j] + duration[j]
 
         # Обновляем, когда роль снова будет доступна
-        role_real_ready[task.role] = task.real_end_time
+        role_real_ready[role] = real_end[j]
+
+    # 3. Расписание записывается в столбцы таблицы; задачи — представления её строк
+    table.planned_duration[:] = planned.duration
+    table.planned_start_time[:] = planned.start
+    table.planned_end_time[:] = planned.end
+    table.real_duration[:] = real_duration
+    table.real_start_time[:] = real_start
+    table.real_end_time[:] = real_end
 
-    return tasks
\ No newline at end of file
+    return plan.tasks if in_place else table.to_tasks(pinned=True)
@@ -0,0 +1,182 @@
+import numpy as np
+from services import kernels
+from services.accumulators import CriticalityAccumulator, SimulationSummary
+from services.kernels import kernels_enabled
+from services.profiling import stage
+from services.sampling import sample_real_durations
+from services.scheduler import compile_plan
+
+def simulate_batch(tasks, percentile, seed, start, stop, sampler="iid", n_iter=None):
+    """
+    Пакетная симуляция: строит расписание (как build_schedule) и считает
+    простой (как calculate_idle_time) сразу для всех итераций.
+
+    :param tasks: список задач или CompiledPlan
+    :param percentile: процентиль длительностей задач для планирования
+    :param seed: энтропия корневого SeedSequence (см. services.sampling.root_seed)
+    :param start, stop: номера итераций [start, stop) — от них зависят потоки случайных чисел
+    :param sampler: стратегия выборки длительностей (см. services.sampling.SAMPLERS)
+    :param n_iter: длина всего прогона (по умолчанию stop), см. sample_real_durations
+    :return: (durations, idle) — массив длительностей проекта
+             и матрица простоя (n_roles, n_iter) в порядке plan.roles
+    """
+    plan = compile_plan(tasks)
+
+    # 1. Плановое расписание детерминировано и берётся из кэша плана
+    planned = plan.planned_schedule(percentile)
+    planned_start = planned.start
+
+    # 2. Фактические длительности и прямой проход в топологическом порядке по всем итерациям сразу
+    #    и простой по ролям (только задержки из-за предшественника другой роли).
+    #    С numba оба шага выполняет одно скомпилированное ядро с тем же результатом
+    size = stop - start
+    with stage("simulation.sample", size):
+        real_duration = sample_real_durations(plan, seed, start, stop, sampler, n_iter)
+    if kernels_enabled():
+        with stage("simulation.kernel", size):
+            real_start, real_end, idle = kernels.simulate_schedule(plan, planned_start, real_duration)
+    else:
+        with stage("simulation.forward_pass", size):
+            real_start, real_end, _ = forward_pass(plan, planned_start, real_duration)
+        with stage("simulation.idle", size):
+            idle = idle_time_matrix(plan, planned_start, real_start, real_end).T
+
+    durations = real_end.max(axis=0)
+    return durations, idle
+
+def forward_pass(plan, planned_start, real_duration, track_binding=False):
+    """
+    Фактическое расписание всех итераций: задача начинается не раньше планового начала,
+    конца предшественников и освобождения своей роли.
+
+    :param real_duration: фактические длительности (n_tasks, n_iter)
+    :param track_binding: запоминать для каждой задачи, что определило её начало
+    :return: (real_start, real_end, binding) — матрицы (n_tasks, n_iter); binding — индекс
+             задачи, конец которой определил начало (предшественник или предыдущая задача роли),
+             или -1, если задача началась в плановое время; без track_binding — None.
+             При равенстве предпочтение у предшественника, затем у роли
+    """
+    n_tasks, n_iter = real_duration.shape
+    real_start = np.zeros((n_tasks, n_iter))
+    real_end = np.zeros((n_tasks, n_iter))
+    role_real_ready = np.zeros((plan.n_roles, n_iter))
+    binding = np.full((n_tasks, n_iter), -1, dtype=np.intp) if track_binding else None
+    role_last = np.full(plan.n_roles, -1, dtype=np.intp)
+
+    for j in plan.order:
+        d = plan.predecessors(j)
+        r = plan.role_ids[j]
+
+        start = np.maximum(role_real_ready[r], planned_start[j])
+        if track_binding and role_last[r] >= 0:
+            binding[j][role_real_ready[r] >= planned_start[j]] = role_last[r]
+        if len(d):
+            dep_end = real_end[d].max(axis=0)
+            if track_binding:
+                by_dependency = dep_end >= start
+                binding[j][by_dependency] = d[np.argmax(real_end[d][:, by_dependency], axis=0)]
+            start = np.maximum(start, dep_end)
+        real_start[j] = start
+        real_end[j] = start + real_duration[j]
+        role_real_ready[r] = real_end[j]
+        role_last[r] = j
+
+    return real_start, real_end, binding
+
+def critical_chains(binding, real_end):
+    """
+    Обратный проход по binding от задачи, закончившейся последней, в каждой итерации.
+
+    :return: булева матрица (n_tasks, n_iter): задача лежит на критической цепочке итерации
+    """
+    n_tasks, n_iter = real_end.shape
+    critical = np.zeros((n_tasks, n_iter), dtype=bool)
+    iterations = np.arange(n_iter)
+    current = np.argmax(real_end, axis=0)
+    while len(iterations):
+        critical[current, iterations] = True
+        current = binding[current, iterations]
+        active = current >= 0
+        iterations, current = iterations[active], current[active]
+    return critical
+
+def simulate_criticality(tasks, percentile, seed, start, stop, sampler="iid", n_iter=None):
+    """
+    Симуляция итераций [start, stop) с отслеживанием критических цепочек.
+    Итерации и потоки случайных чисел те же, что у simulate_batch.
+
+    :return: CriticalityAccumulator с индексом критичности задач и вкладом ролей в перерасход
+    """
+    plan = compile_plan(tasks)
+    planned = plan.planned_schedule(percentile)
+    real_duration = sample_real_durations(plan, seed, start, stop, sampler, n_iter)
+    _, real_end, binding = forward_pass(plan, planned.start, real_duration, track_binding=True)
+    critical = critical_chains(binding, real_end)
+
+    # вклад роли: превышение фактической длительности над плановой у критических задач роли
+    # в итерациях, где проект не уложился в плановый срок
+    overran = real_end.max(axis=0) > planned.project_end
+    excess = np.maximum(real_duration - planned.duration[:, None], 0.0)
+    excess = np.where(critical & overran, excess, 0.0).sum(axis=1)
+    role_overrun = np.bincount(plan.role_ids, weights=excess, minlength=plan.n_roles)
+
+    accumulator = CriticalityAccumulator(plan.task_ids.tolist(), plan.roles)
+    accumulator.update(critical.sum(axis=1), role_overrun, stop - start)
+    return accumulator
+
+def idle_time_matrix(plan, planned_start, real_start, real_end):
+    """
+    Простой по ролям для многих итераций сразу (как calculate_idle_time для каждой итерации).
+    Последний завершившийся предшественник ищется сегментным argmax по CSR-индексу:
+    задачи группируются по числу предшественников k, и для группы из m задач
+    argmax берётся по оси k массива (m, k, n_iter). Задержки из-за предшественника
+    другой роли суммируются по ролям сразу по всем итерациям.
+
+    :param plan: CompiledPlan
+    :param planned_start: плановые начала задач (n_tasks,)
+    :param real_start, real_end: фактические начала и концы (n_tasks, n_iter)
+    :return: матрица простоя (n_iter, n_roles) в порядке plan.roles
+    """
+    n_iter = real_end.shape[1]
+    counts = np.diff(plan.dep_offsets)
+    idle = np.zeros((plan.n_roles, n_iter))
+
+    for k in np.unique(counts[counts > 0]):
+        tasks = np.flatnonzero(counts == k)
+        preds = plan.dep_indices[plan.dep_offsets[tasks][:, None] + np.arange(k)]  # (m, k)
+        if k == 1:
+            latest_pred = preds
+        else:
+            # np.argmax берёт первый максимум — как max(...) в calculate_idle_time
+            first_max = real_end[preds].argmax(axis=1)
+            latest_pred = np.take_along_axis(preds, first_max, axis=1)
+
+        roles = plan.role_ids[tasks]
+        delay = real_start[tasks] - planned_start[tasks][:, None]
+        mask = (delay > 0) & (plan.role_ids[latest_pred] != roles[:, None])
+
+        # строки задач добавляются к строкам их ролей по порядку (np.add.at): порядок сложения
+        # не зависит от числа итераций, и результат одинаков при любом разбиении прогона на части
+        np.add.at(idle, roles, np.where(mask, delay, 0.0))
+
+    return idle.T
+
+def idle_by_role(plan, idle):
+    """
+    Матрица простоя (n_roles, n_iter) → словарь роль → массив простоя по итерациям
+    """
+    return {role: idle[k] for k, role in enumerate(plan.roles)}
+
+def simulate_summary(tasks, percentile, seed, start, stop, bin_width=0.01, batch_size=10_000, sampler="iid", n_iter=None):
+    """
+    Потоковый вариант simulate_batch: итерации [start, stop) считаются пакетами
+    по batch_size и сразу сворачиваются в SimulationSummary, так что память
+    не растёт с числом итераций
+    """
+    plan = compile_plan(tasks)
+    summary = SimulationSummary(plan.roles, bin_width)
+    for batch_start in range(start, stop, batch_size):
+        batch_stop = min(batch_start + batch_size, stop)
+        durations, idle = simulate_batch(plan, percentile, seed, batch_start, batch_stop, sampler, n_iter or stop)
+        summary.update(durations, idle)
+    return summary
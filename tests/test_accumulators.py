@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from services.accumulators import HistogramAccumulator, MomentAccumulator, SimulationSummary
+from services.metrics import iteration_chunks, monte_carlo_simulation, parallel_monte_carlo_simulation
+
+def _chunked(accumulator_type, values, chunk_size, **kwargs):
+    """Аккумулятор каждого отрезка отдельно, затем объединение по порядку — как части прогона"""
+    total = accumulator_type(**kwargs)
+    for start, stop in iteration_chunks(len(values), chunk_size):
+        part = accumulator_type(**kwargs)
+        part.update(values[start:stop])
+        total.merge(part)
+    return total
+
+def test_moments_merged_across_chunks_match_numpy():
+    values = np.random.default_rng(0).lognormal(3, 0.4, 10_001)
+    for chunk_size in (1, 7, 1000, 20_000):
+        moments = _chunked(MomentAccumulator, values, chunk_size)
+        assert moments.count == len(values)
+        assert moments.mean == pytest.approx(np.mean(values), rel=1e-12)
+        assert moments.variance == pytest.approx(np.var(values, ddof=1), rel=1e-10)
+        assert (moments.min, moments.max) == (values.min(), values.max())
+
+def test_histogram_merged_across_chunks_matches_numpy_quantiles():
+    values = np.random.default_rng(1).lognormal(3, 0.4, 10_001)
+    q = np.array([0.01, 0.1, 0.5, 0.9, 0.99])
+    whole = HistogramAccumulator(0.01)
+    whole.update(values)
+    for chunk_size in (1, 7, 1000):
+        histogram = _chunked(HistogramAccumulator, values, chunk_size, bin_width=0.01)
+        assert np.array_equal(histogram.counts, whole.counts)
+        # погрешность квантиля по гистограмме не больше ширины корзины
+        assert np.all(np.abs(histogram.quantile(q) - np.quantile(values, q)) <= 0.01)
+
+def test_streaming_summary_matches_full_run():
+    durations, idle = monte_carlo_simulation("data/tasks.csv", 0.5, 2000, seed=2, use_cache=False)
+    summary = parallel_monte_carlo_simulation("data/tasks.csv", [0.5], 2000, seed=2, chunk_size=300,
+                                              max_workers=2, streaming=True)[0.5]
+    assert isinstance(summary, SimulationSummary)
+    assert summary.count == len(durations)
+    assert summary.durations.mean == pytest.approx(np.mean(durations), rel=1e-12)
+    assert summary.durations.variance == pytest.approx(np.var(durations, ddof=1), rel=1e-10)
+    assert np.all(np.abs(summary.quantile([0.1, 0.5, 0.9]) - np.quantile(durations, [0.1, 0.5, 0.9])) <= 0.01)
+    for role, value in summary.mean_idle().items():
+        assert value == pytest.approx(np.mean(idle[role]), rel=1e-12)
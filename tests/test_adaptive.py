@@ -0,0 +1,33 @@
+import numpy as np
+from services.metrics import (adaptive_monte_carlo_simulation, confidence_half_width, monte_carlo_simulation,
+                              parallel_adaptive_monte_carlo_simulation)
+
+TASKS = "data/tasks.csv"
+
+def test_stops_at_first_batch_within_tolerance():
+    """Прогон останавливается на первом пакете, после которого полуширина интервала не больше tolerance"""
+    for target in ("mean", 90):
+        durations, _, report = adaptive_monte_carlo_simulation(TASKS, 0.5, seed=5, tolerance=0.1, target=target,
+                                                               batch_size=250, max_iter=100_000)
+        n = report["n_iter"]
+        assert report["converged"] and n == len(durations) and n % 250 == 0
+        assert report["half_width"] == confidence_half_width(durations, target) <= 0.1
+        assert confidence_half_width(durations[:n - 250], target) > 0.1
+        # итерации те же, что у обычного прогона той же длины
+        assert np.array_equal(durations, monte_carlo_simulation(TASKS, 0.5, n, seed=5, use_cache=False)[0])
+
+def test_respects_max_iter():
+    durations, idle, report = adaptive_monte_carlo_simulation(TASKS, 0.5, seed=5, tolerance=1e-6,
+                                                              batch_size=1000, max_iter=2500)
+    assert len(durations) == report["n_iter"] == 2500
+    assert all(len(values) == 2500 for values in idle.values())
+    assert not report["converged"] and report["half_width"] > 1e-6
+
+def test_parallel_matches_single_process():
+    results = parallel_adaptive_monte_carlo_simulation(TASKS, [0.5, 0.9], seed=5, tolerance=0.1, batch_size=250,
+                                                       max_iter=3000, chunk_size=100, max_workers=2)
+    for p, (durations, _, report) in results.items():
+        expected, _, expected_report = adaptive_monte_carlo_simulation(TASKS, p, seed=5, tolerance=0.1,
+                                                                       batch_size=250, max_iter=3000)
+        assert np.array_equal(durations, expected)
+        assert report == expected_report
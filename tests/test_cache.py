@@ -0,0 +1,29 @@
+import numpy as np
+from services.cache import configure_result_cache
+from services.metrics import monte_carlo_simulation, parallel_monte_carlo_simulation
+
+TASKS = "data/tasks.csv"
+
+def test_results_are_writable_on_miss_and_hit():
+    """Результаты Монте-Карло изменяемы и при промахе, и при попадании в кэш"""
+    configure_result_cache()
+    for _ in range(2):
+        durations, idle = monte_carlo_simulation(TASKS, 0.5, 200, seed=1)
+        expected = np.sort(durations)
+        durations.sort()
+        np.testing.assert_array_equal(durations, expected)
+        for values in idle.values():
+            values[:] = 0
+
+    # изменения вызывающего не попадают в кэш
+    cached, _ = monte_carlo_simulation(TASKS, 0.5, 200, seed=1)
+    assert not np.array_equal(cached, expected)
+    np.testing.assert_array_equal(np.sort(cached), expected)
+
+def test_parallel_results_are_writable():
+    configure_result_cache()
+    for _ in range(2):
+        durations, idle = parallel_monte_carlo_simulation(TASKS, [0.5], 200, seed=1, max_workers=1)[0.5]
+        durations.sort()
+        for values in idle.values():
+            values[:] = 0
@@ -0,0 +1,15 @@
+import numpy as np
+from services.exporter import schedule_columns
+from models.task import schedule_matrix
+from services.parser import load_task_table
+from services.scheduler import build_schedule
+
+def test_table_columns_match_task_columns():
+    """Столбцы по TaskTable совпадают со столбцами по списку задач"""
+    table = load_task_table("data/tasks.csv")
+    table.schedule[:] = schedule_matrix(build_schedule("data/tasks.csv", 0.5, seed=1))
+    from_table = schedule_columns(table)
+    from_tasks = schedule_columns(table.to_tasks())
+    assert list(from_table) == list(from_tasks)
+    for name in from_table:
+        assert np.asarray(from_table[name]).tolist() == np.asarray(from_tasks[name]).tolist(), name
@@ -0,0 +1,59 @@
+import io
+import numpy as np
+import pytest
+from benchmarks.generator import generate_plan
+from models.task import TaskTable
+from services.incremental import IncrementalScheduler
+from services.parser import load_task_table
+from services.scheduler import CompiledPlan
+
+PERCENTILES = (0.5, 0.9)
+
+def _recompiled(scheduler):
+    """План текущего состояния, скомпилированный заново без инкрементальных расписаний"""
+    dep_offsets, dep_indices = scheduler._csr()
+    table = TaskTable(scheduler.task_ids, scheduler.roles, scheduler.role_ids, scheduler.mean,
+                      scheduler.stddev, dep_offsets, dep_indices)
+    return CompiledPlan.from_table(table)
+
+def test_random_edits_match_full_recompile():
+    """После каждой случайной правки расписание совпадает с полной перекомпиляцией плана"""
+    table = load_task_table(io.StringIO(generate_plan(60, n_roles=4, seed=3).to_csv(index=False)))
+    scheduler = IncrementalScheduler(CompiledPlan.from_table(table), PERCENTILES)
+    task_ids = scheduler.task_ids.tolist()
+    rng = np.random.default_rng(0)
+
+    for _ in range(200):
+        task_id = task_ids[rng.integers(len(task_ids))]
+        action = rng.integers(3)
+        if action == 0:
+            mean = float(rng.uniform(1, 10))
+            scheduler.set_task(task_id, mean=mean, stddev=float(mean * rng.uniform(0.05, 0.3)))
+        elif action == 1:
+            try:
+                scheduler.add_dependency(task_id, task_ids[rng.integers(len(task_ids))])
+            except ValueError:
+                pass  # цикл отклонён, план не изменился
+        else:
+            deps = scheduler.dependencies[scheduler.index[task_id]]
+            if deps:
+                scheduler.remove_dependency(task_id, int(scheduler.task_ids[deps[rng.integers(len(deps))]]))
+
+        expected = _recompiled(scheduler)
+        assert scheduler.order.tolist() == expected.order.tolist()
+        for p in PERCENTILES:
+            planned, reference = scheduler.plan.planned_schedule(p), expected.planned_schedule(p)
+            np.testing.assert_allclose(planned.start, reference.start, rtol=1e-12)
+            np.testing.assert_allclose(planned.end, reference.end, rtol=1e-12)
+            assert scheduler.project_end(p) == pytest.approx(reference.project_end, rel=1e-12)
+        assert scheduler.plan.digest() == expected.digest()
+
+def test_cyclic_dependency_is_rejected():
+    """Зависимость предшественника от своего последователя образует цикл и отклоняется"""
+    scheduler = IncrementalScheduler(CompiledPlan.from_table(load_task_table("data/tasks.csv")), PERCENTILES)
+    j = next(j for j, deps in enumerate(scheduler.dependencies) if deps)
+    task_id, dependency_id = int(scheduler.task_ids[j]), int(scheduler.task_ids[scheduler.dependencies[j][0]])
+    before = [list(deps) for deps in scheduler.dependencies]
+    with pytest.raises(ValueError):
+        scheduler.add_dependency(dependency_id, task_id)
+    assert scheduler.dependencies == before
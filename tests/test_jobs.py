@@ -0,0 +1,23 @@
+import asyncio
+from benchmarks.generator import generate_plan
+from services.jobs import SimulationService
+from services.pool import SimulationPool
+
+def test_least_recently_used_plans_are_evicted():
+    async def run():
+        with SimulationPool(1) as pool:
+            service = SimulationService(pool, max_plans=2)
+            plans = []
+            for seed in range(4):
+                plan = await service.add_plan(generate_plan(50, seed=seed).to_csv(index=False).encode())
+                await service.simulate(plan, 0.5, 20, seed=1)
+                plans.append(plan)
+            assert list(service.plans) == [plan.digest() for plan in plans[2:]]
+            assert len(pool._handles) == len(pool._blocks) == 2
+
+            # вытесненный план можно снова загрузить и посчитать
+            plan = await service.add_plan(generate_plan(50, seed=0).to_csv(index=False).encode())
+            durations, _ = await service.simulate(plan, 0.5, 30, seed=1)
+            assert len(durations) == 30
+            assert len(pool._handles) == 2
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from benchmarks.generator import generate_plan
+from services import kernels
+from services.sampling import sample_real_durations
+from services.scheduler import CompiledPlan, PlannedSchedule, compile_plan
+from services.simulation import forward_pass, idle_time_matrix, simulate_batch
+
+pytest.importorskip("numba")
+
+PERCENTILES = (0.1, 0.5, 0.9)
+
+@pytest.fixture(params=["bundled", "generated"])
+def plan(request, tmp_path):
+    if request.param == "bundled":
+        return compile_plan("data/tasks.csv")
+    path = tmp_path / "generated.csv"
+    generate_plan(2_000, n_roles=5, fan_in=4, seed=3).to_csv(path, index=False)
+    return compile_plan(str(path))
+
+@pytest.fixture
+def numpy_path():
+    """Путь на NumPy на время теста"""
+    enabled = kernels.kernels_enabled()
+    kernels.configure_kernels(False)
+    yield
+    kernels.configure_kernels(enabled)
+
+def _numpy_planned(plan, p):
+    """Плановое расписание по ветке PlannedSchedule на NumPy"""
+    enabled = kernels.kernels_enabled()
+    kernels.configure_kernels(False)
+    try:
+        return PlannedSchedule(plan, p)
+    finally:
+        kernels.configure_kernels(enabled)
+
+@pytest.mark.parametrize("p", PERCENTILES)
+def test_planned_schedule_matches_numpy(plan, p):
+    expected = _numpy_planned(plan, p)
+    start, end = kernels.planned_schedule(plan, expected.duration)
+    np.testing.assert_array_equal(start, expected.start)
+    np.testing.assert_array_equal(end, expected.end)
+
+@pytest.mark.parametrize("p", PERCENTILES)
+def test_simulate_schedule_matches_numpy(plan, p):
+    planned = _numpy_planned(plan, p)
+    real_duration = sample_real_durations(plan, 7, 0, 200)
+    real_start, real_end, idle = kernels.simulate_schedule(plan, planned.start, real_duration)
+
+    expected_start, expected_end, _ = forward_pass(plan, planned.start, real_duration)
+    np.testing.assert_array_equal(real_start, expected_start)
+    np.testing.assert_array_equal(real_end, expected_end)
+    np.testing.assert_array_equal(idle, idle_time_matrix(plan, planned.start, expected_start, expected_end).T)
+
+def test_simulate_batch_matches_numpy(plan, numpy_path):
+    expected = simulate_batch(CompiledPlan.from_arrays(plan.roles, **plan.arrays()), 0.5, 11, 0, 300)
+    kernels.configure_kernels(True)
+    actual = simulate_batch(CompiledPlan.from_arrays(plan.roles, **plan.arrays()), 0.5, 11, 0, 300)
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
@@ -0,0 +1,29 @@
+import numpy as np
+from services.metrics import monte_carlo_simulation, parallel_monte_carlo_simulation
+
+TASKS = "data/tasks.csv"
+PERCENTILES = [0.5, 0.9]
+
+def test_parallel_results_do_not_depend_on_chunking():
+    """Результат побитово одинаков при любых chunk_size и числе процессов и совпадает с monte_carlo_simulation"""
+    for sampler in ("iid", "lhs"):
+        reference = {p: monte_carlo_simulation(TASKS, p, 500, seed=4, use_cache=False, sampler=sampler)
+                     for p in PERCENTILES}
+        for chunk_size, max_workers in ((1000, 1), (37, 2), (128, 3)):
+            results = parallel_monte_carlo_simulation(TASKS, PERCENTILES, 500, seed=4, chunk_size=chunk_size,
+                                                      max_workers=max_workers, use_cache=False, sampler=sampler)
+            for p in PERCENTILES:
+                durations, idle = results[p]
+                assert np.array_equal(durations, reference[p][0]), (sampler, chunk_size, p)
+                assert idle.keys() == reference[p][1].keys()
+                for role in idle:
+                    assert np.array_equal(idle[role], reference[p][1][role]), (sampler, chunk_size, p, role)
+
+def test_parallel_with_no_iterations():
+    results = parallel_monte_carlo_simulation(TASKS, PERCENTILES, 0, seed=1, max_workers=1, use_cache=False)
+    for durations, idle in results.values():
+        assert len(durations) == 0
+        assert all(len(values) == 0 for values in idle.values())
+
+    summaries = parallel_monte_carlo_simulation(TASKS, PERCENTILES, 0, seed=1, max_workers=1, streaming=True)
+    assert all(summary.count == 0 for summary in summaries.values())
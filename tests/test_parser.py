@@ -0,0 +1,29 @@
+import io
+import pytest
+from services.parser import load_task_table
+
+HEADER = "task_id,role,dependencies,mean,stddev\n"
+
+def _load(rows):
+    return load_task_table(io.StringIO(HEADER + "\n".join(rows) + "\n"))
+
+def test_valid_plan_is_ordered_by_dependencies():
+    table = _load(['1,a,"2",1,0.1', "2,a,,1,0.1", '3,b,"1,2",1,0.1'])
+    assert table.task_ids[table.order].tolist() == [2, 1, 3]
+
+def test_cycle_reports_only_tasks_on_the_cycle():
+    """Задача 3 лишь зависит от цикла 1 ↔ 2 и в сообщение не попадает"""
+    with pytest.raises(ValueError, match=r"Циклические зависимости между задачами: \[1, 2\]"):
+        _load(['1,a,"2",1,0.1', '2,a,"1",1,0.1', '3,b,"2",1,0.1', "4,b,,1,0.1"])
+
+def test_self_dependency_is_a_cycle():
+    with pytest.raises(ValueError, match=r"Циклические зависимости между задачами: \[2\]"):
+        _load(["1,a,,1,0.1", '2,a,"1,2",1,0.1', '3,a,"2",1,0.1'])
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError, match=r"Неизвестные предшественники: \[7\]"):
+        _load(["1,a,,1,0.1", '2,a,"1,7",1,0.1'])
+
+def test_duplicate_task_id():
+    with pytest.raises(ValueError, match=r"Повторяющиеся id задач: \[2\]"):
+        _load(["1,a,,1,0.1", "2,a,,1,0.1", '2,b,"1",1,0.1'])
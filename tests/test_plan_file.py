@@ -0,0 +1,29 @@
+import os
+import shutil
+import pytest
+from services.pool import PlanFileHandle
+from services.scheduler import compile_plan_file
+
+def test_same_name_csv_in_different_directories(tmp_path):
+    """Одноимённые CSV из разных каталогов не удаляют планы друг друга"""
+    sources = []
+    for sub in ("a", "b"):
+        os.makedirs(tmp_path / sub)
+        sources.append(str(shutil.copy("data/tasks.csv", tmp_path / sub / "tasks.csv")))
+    plans = [compile_plan_file(source, str(tmp_path / "plans")) for source in sources]
+
+    assert plans[0].plan_file != plans[1].plan_file
+    assert all(os.path.isdir(plan.plan_file) for plan in plans)
+    assert PlanFileHandle(plans[0].plan_file).attach().digest() == plans[0].digest()
+
+def test_edited_csv_replaces_its_plan(tmp_path):
+    source = str(shutil.copy("data/tasks.csv", tmp_path / "tasks.csv"))
+    old = compile_plan_file(source, str(tmp_path / "plans")).plan_file
+    with open(source, "a", encoding="utf-8") as f:
+        f.write("\n")
+    new = compile_plan_file(source, str(tmp_path / "plans")).plan_file
+    assert new != old and not os.path.exists(old) and os.path.isdir(new)
+
+def test_missing_plan_file_is_reported(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        PlanFileHandle(str(tmp_path / "missing")).attach()
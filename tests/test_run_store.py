@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from services.run_store import QUANTILES, RunStore
+from services.scheduler import compile_plan
+from services.simulation import simulate_batch
+
+def test_appended_summary_matches_full_run(tmp_path):
+    """Сводка прогона, дописанного частями, совпадает со сводкой по всем итерациям сразу"""
+    plan = compile_plan("data/tasks.csv")
+    durations, idle = simulate_batch(plan, 0.5, 5, 0, 1000)
+    with RunStore(str(tmp_path)) as store:
+        for start, stop in ((0, 1), (1, 300), (300, 1000)):
+            store.append(plan, 0.5, 5, "iid", start, durations[start:stop], idle[:, start:stop])
+        summary = store.summaries(plan).iloc[0]
+
+    assert summary["n_iter"] == 1000
+    assert summary["mean"] == pytest.approx(np.mean(durations), rel=1e-12)
+    assert summary["std"] == pytest.approx(np.std(durations, ddof=1), rel=1e-9)
+    assert (summary["min"], summary["max"]) == (durations.min(), durations.max())
+    for q, value in zip(QUANTILES, np.quantile(durations, QUANTILES)):
+        assert summary[f"q{q:g}"] == value
+    for k, role in enumerate(plan.roles):
+        assert summary[f"Простой_{role}"] == pytest.approx(np.mean(idle[k]), rel=1e-12, abs=1e-12)
+
+def test_max_runs_keeps_recent_runs(tmp_path):
+    plan = compile_plan("data/tasks.csv")
+    durations, idle = simulate_batch(plan, 0.5, 5, 0, 10)
+    with RunStore(str(tmp_path), max_runs=2) as store:
+        ids = [store.append(plan, 0.5, seed, "iid", 0, durations, idle) for seed in (1, 2, 3)]
+        assert store.summaries(plan).index.tolist() == ids[1:]
+        assert not (tmp_path / str(ids[0])).exists()
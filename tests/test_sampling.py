@@ -0,0 +1,23 @@
+import numpy as np
+from services.metrics import iteration_chunks
+from services.sampling import _lhs_uniforms, root_seed, sample_real_durations
+from services.scheduler import compile_plan
+
+TASKS = "data/tasks.csv"
+
+def test_lhs_covers_every_stratum_once():
+    """У каждой задачи каждая из n_iter страт получает ровно одну итерацию прогона"""
+    for n_iter in (1, 2, 5, 64, 1000, 1537):
+        uniforms = _lhs_uniforms(root_seed(3), 0, n_iter, 7, n_iter)
+        strata = np.sort(np.floor(uniforms * n_iter).astype(int), axis=0)
+        assert (strata == np.arange(n_iter)[:, None]).all()
+
+def test_lhs_does_not_depend_on_chunking():
+    """Выборки "lhs" одинаковы при любом разбиении прогона на части"""
+    plan = compile_plan(TASKS)
+    seed, n_iter = root_seed(11), 1000
+    whole = sample_real_durations(plan, seed, 0, n_iter, "lhs", n_iter)
+    for chunk_size in (1, 7, 256, 999):
+        parts = [sample_real_durations(plan, seed, start, stop, "lhs", n_iter)
+                 for start, stop in iteration_chunks(n_iter, chunk_size)]
+        assert np.array_equal(np.hstack(parts), whole)
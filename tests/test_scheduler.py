@@ -0,0 +1,31 @@
+from services.metrics import calculate_project_duration
+from services.parser import load_tasks_from_csv
+from services.scheduler import build_schedule, compile_plan
+
+TASKS = "data/tasks.csv"
+
+def test_task_views_are_not_rebound_to_a_new_plan():
+    """Расписание по задачам плана файла не меняет сам план файла из кэша compile_plan"""
+    tasks = build_schedule(TASKS, 0.5, seed=1)
+    expected = calculate_project_duration(tasks)
+
+    rescheduled = build_schedule(tasks, 0.9, seed=1)
+    assert calculate_project_duration(rescheduled) > expected
+    assert calculate_project_duration(tasks) == expected
+    assert calculate_project_duration(build_schedule(TASKS, 0.5, seed=1)) == expected
+
+def test_repeated_calls_do_not_overwrite_earlier_results():
+    """Второй вызов по пути или плану из кэша не переписывает задачи первого"""
+    for source in (TASKS, compile_plan(TASKS)):
+        first = build_schedule(source, 0.5, seed=1)
+        before = [(task.planned_end_time, task.real_end_time) for task in first]
+        second = build_schedule(source, 0.9, seed=2)
+        assert [(task.planned_end_time, task.real_end_time) for task in first] == before
+        assert calculate_project_duration(second) != calculate_project_duration(first)
+
+def test_standalone_tasks_are_scheduled_in_place():
+    """Отдельно созданные задачи, как и раньше, получают расписание в своих объектах"""
+    tasks = load_tasks_from_csv(TASKS)
+    scheduled = build_schedule(tasks, 0.5, seed=1)
+    assert scheduled == tasks
+    assert calculate_project_duration(tasks) == calculate_project_duration(build_schedule(TASKS, 0.5, seed=1))
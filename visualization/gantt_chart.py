@@ -1,49 +1,121 @@
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-import matplotlib.colors as mcolors
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+import numpy as np
+from services.profiling import profiled
 
-def plot_gantt(tasks, filename, pr_buffer):
-    _, ax = plt.subplots(figsize=(14, 6))
+# До этого числа задач каждая задача рисуется отдельной строкой (режим "auto")
+DETAIL_LIMIT = 200
 
-    roles = sorted({task.role for task in tasks})
-    color_map = dict(zip(roles, cm.get_cmap('Accent').colors))
+def _bars(y, left, width, height):
+    """Прямоугольники полос (y — центр строки) в виде вершин для PolyCollection"""
+    y, left, width = (np.asarray(a, dtype=float) for a in (y, left, width))
+    verts = np.empty((len(y), 4, 2))
+    verts[:, 0, 0] = verts[:, 1, 0] = left
+    verts[:, 2, 0] = verts[:, 3, 0] = left + width
+    verts[:, 0, 1] = verts[:, 3, 1] = y - height / 2
+    verts[:, 1, 1] = verts[:, 2, 1] = y + height / 2
+    return verts
 
-    y_labels = []
-    yticks = []
+def _rows(mode, role_ids, roles, task_ids, real_start, n_buckets):
+    """
+    Строка диаграммы для каждой задачи и подписи строк.
 
-    for i, task in enumerate(sorted(tasks, key=lambda t: t.real_start_time)):
-        y_labels.append(f"Задача {task.task_id} ({task.role})")
-        yticks.append(i)
+    tasks   — строка на задачу (по фактическому началу);
+    roles   — дорожка на роль: задачи роли выполняются по очереди и не перекрываются;
+    buckets — строка на интервал времени фактического начала
+    """
+    if mode == "tasks":
+        order = np.argsort(real_start, kind="stable")
+        y = np.empty(len(order))
+        y[order] = np.arange(len(order))
+        labels = [f"Задача {task_ids[j]} ({roles[role_ids[j]]})" for j in order]
+        return y, labels
+    if mode == "roles":
+        return role_ids.astype(float), [f"Роль {role}" for role in roles]
 
-        role_color = color_map[task.role]
+    edges = np.linspace(real_start.min(), real_start.max(), n_buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, real_start, side="right") - 1, 0, n_buckets - 1)
+    labels = [f"Начало {edges[k]:.1f}–{edges[k + 1]:.1f}" for k in range(n_buckets)]
+    return bucket.astype(float), labels
 
-        # Плановое время
-        ax.barh(i, task.planned_duration, left=task.planned_start_time, height=0.5, color=role_color, alpha=0.8)
+@profiled("plot.gantt")
+def plot_gantt(tasks, filename, pr_buffer, mode="auto", max_labels=60, n_buckets=40):
+    """
+    Диаграмма Ганта: плановые полосы цветом роли, фактические — чёрным поверх, буфер проекта — красным.
 
-        # Реальное выполнение (поверх плана, уже с другим уровнем)
-        ax.barh(i, task.real_duration, left=task.real_start_time, height=0.2, color='black')
+    Полосы каждой роли и каждого слоя рисуются одним PolyCollection, поэтому время
+    отрисовки растёт почти линейно с числом задач. Для больших планов задачи
+    сводятся в дорожки ролей или интервалы времени, а подписи строк прореживаются.
 
-    # --- Буфер проекта ---
-    if pr_buffer is not None and pr_buffer > 0:
-        planned_end_project = max(task.planned_end_time for task in tasks)
+    :param tasks: список задач с рассчитанным расписанием
+    :param filename: путь для сохранения графика
+    :param pr_buffer: буфер проекта (None или 0 — без буфера)
+    :param mode: "tasks" — строка на задачу, "roles" — дорожка на роль,
+                 "buckets" — строка на интервал времени начала,
+                 "auto" — "tasks" до DETAIL_LIMIT задач, иначе "roles"
+    :param max_labels: наибольшее число подписей по оси Y
+    :param n_buckets: число интервалов времени в режиме "buckets"
+    """
+    if mode == "auto":
+        mode = "tasks" if len(tasks) <= DETAIL_LIMIT else "roles"
+    if mode not in ("tasks", "roles", "buckets"):
+        raise ValueError(f"Неизвестный режим диаграммы Ганта: {mode}")
+
+    roles = sorted({task.role for task in tasks})
+    role_index = {role: k for k, role in enumerate(roles)}
+    role_ids = np.array([role_index[task.role] for task in tasks], dtype=np.intp)
+    task_ids = [task.task_id for task in tasks]
+    planned_start = np.array([task.planned_start_time for task in tasks], dtype=float)
+    planned_duration = np.array([task.planned_duration for task in tasks], dtype=float)
+    real_start = np.array([task.real_start_time for task in tasks], dtype=float)
+    real_duration = np.array([task.real_duration for task in tasks], dtype=float)
 
-        ax.barh(
-            len(tasks), pr_buffer, 
-            left=planned_end_project, 
-            height=0.5, color='red', alpha=0.6
-        )
+    y, y_labels = _rows(mode, role_ids, roles, task_ids, real_start, n_buckets)
+    n_rows = len(y_labels)
 
-        y_labels.append("Буфер проекта")
-        yticks.append(len(tasks))
+    figure = Figure(figsize=(14, min(max(6, 0.25 * n_rows), 24)))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
 
+    colors = matplotlib.colormaps["Accent"].colors
+    for k, role in enumerate(roles):
+        mask = role_ids == k
+        # Плановое время
+        ax.add_collection(PolyCollection(
+            _bars(y[mask], planned_start[mask], planned_duration[mask], 0.5),
+            facecolors=colors[k % len(colors)], edgecolors="none", alpha=0.8
+        ))
+    # Реальное выполнение (поверх плана, уже с другим уровнем)
+    ax.add_collection(PolyCollection(_bars(y, real_start, real_duration, 0.2), facecolors="black", edgecolors="none"))
+
+    # --- Буфер проекта ---
+    if pr_buffer is not None and pr_buffer > 0:
+        planned_end_project = np.max(planned_start + planned_duration)
+        ax.add_collection(PolyCollection(
+            _bars([n_rows], [planned_end_project], [pr_buffer], 0.5),
+            facecolors="red", edgecolors="none", alpha=0.6
+        ))
+        y_labels = y_labels + ["Буфер проекта"]
+
+    # прореживание подписей: не больше max_labels, строка буфера подписывается всегда
+    step = max(1, int(np.ceil(len(y_labels) / max_labels)))
+    yticks = list(range(0, len(y_labels), step))
+    if yticks[-1] != len(y_labels) - 1 and len(y_labels) > n_rows:
+        yticks.append(len(y_labels) - 1)
     ax.set_yticks(yticks)
-    ax.set_yticklabels(y_labels)
+    ax.set_yticklabels([y_labels[i] for i in yticks])
+
+    ax.autoscale_view()
+    ax.set_ylim(-0.5 - 0.1, len(y_labels) - 0.5 + 0.1)
     ax.set_xlabel("Время")
     ax.set_title("Диаграмма Ганта: план vs. факт (цвет = роль)")
-    ax.legend(handles=[
-        plt.Rectangle((0, 0), 1, 1, color='black', label='Факт'),
-        plt.Rectangle((0, 0), 1, 1, color='gray', alpha=0.6, label='План')
+    # loc="best" перебирает все полосы при каждой отрисовке: на больших планах положение фиксируется
+    ax.legend(loc="best" if len(tasks) <= DETAIL_LIMIT else "upper left", handles=[
+        Rectangle((0, 0), 1, 1, color='black', label='Факт'),
+        Rectangle((0, 0), 1, 1, color='gray', alpha=0.6, label='План')
     ])
-    plt.tight_layout()
-    plt.savefig(filename)
-    plt.close()
+    figure.tight_layout()
+    figure.savefig(filename)
@@ -0,0 +1,27 @@
+import matplotlib.pyplot as plt
+import seaborn as sns
+from services.profiling import profiled
+
+@profiled("plot.heatmap")
+def plot_percentile_heatmap(matrix, task_percentiles, project_percentiles, title, filename):
+    """
+    Рисует тепловую карту: строки — процентили задач, столбцы — процентили проекта.
+
+    :param matrix: матрица значений (len(task_percentiles), len(project_percentiles))
+    :param task_percentiles: процентили задач (ось Y)
+    :param project_percentiles: процентили проекта (ось X)
+    :param title: заголовок графика
+    :param filename: путь для сохранения графика
+    """
+    plt.figure(figsize=(10, 6))
+    ax = sns.heatmap(matrix,
+                annot=True, fmt=".1f", cmap="mako",
+                xticklabels=[f"p={p :.2f}" for p in project_percentiles],
+                yticklabels=[f"p={t :.2f}" for t in task_percentiles])
+    ax.invert_yaxis()  # переворачиваем ось Y, чтобы 0-й индекс был снизу
+    plt.xlabel("Процентиль проекта")
+    plt.ylabel("Процентиль задачи")
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(filename, dpi=300)
+    plt.close()
@@ -1,11 +1,13 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.optimize import curve_fit
+from services.profiling import profiled
 
 def exp_func(x, a, b, c):
     """Экспоненциальная аппроксимация"""
     return a * np.exp(b * x) + c
 
+@profiled("plot.idle_vs_duration")
 def plot_idle_vs_duration(durations, idles_sum, percentiles_tasks, n_iter, save_path):
     """
     Рисует график Парето: средняя длительность проекта vs средний суммарный простой.
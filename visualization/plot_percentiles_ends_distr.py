@@ -1,80 +1,274 @@
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.stats import gaussian_kde
+import hashlib
+import os
 import matplotlib.patheffects as pe
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+from scipy.signal import fftconvolve
+from services.pool import using_pool
+from services.profiling import profiled
+
+# Меняется при изменении оформления графиков, чтобы ранее сохранённые PNG перерисовались
+PLOT_VERSION = 1
+# Ключ в метаданных PNG, где хранится хэш входных данных графика
+DIGEST_KEY = "planner-digest"
+# Быстрое сжатие PNG: пиксели те же, файл чуть больше, а сохранение в разы быстрее
+PNG_COMPRESS_LEVEL = 1
+# Число узлов сетки, на которую раскладываются выборки для KDE
+KDE_BINS = 2048
+# Наибольшее число точек кривой CDF: при большей выборке CDF строится по накопленной гистограмме
+CDF_POINTS = 2048
+
+COLORS = ["skyblue", "orange", "green", "red", "purple"]
 
-def plot_percentile_pdf(durations_list, labels, filename, bins=40, xlim=(40, 80)):
+# Заготовки графиков в процессе: вид графика → (figure, axes, рисунки последнего графика)
+_templates = {}
+
+def binned_kde(samples, x_grid, n_bins=KDE_BINS):
     """
-    Рисует распределения длительности проекта для нескольких наборов данных:
-    - гистограмма (фон)
-    - KDE-кривая поверх неё
+    Оценка плотности гауссовым ядром (ширина по правилу Скотта, как у scipy gaussian_kde)
+    на сгруппированных данных: выборка раскладывается по n_bins узлам сетки
+    (линейная интерполяция весов), свёртка с ядром считается через FFT,
+    а значения в x_grid — интерполяцией между узлами.
+    Время не зависит от произведения размера выборки на число точек x_grid.
 
-    :param durations_list: список массивов с длительностями (например, [dur1, dur2, dur3])
-    :param labels: список подписей (например, ["p=50%", "p=70%", "p=90%"])
-    :param filename: путь для сохранения графика
-    :param bins: количество корзин гистограммы
-    :param xlim: диапазон по оси X (tuple)
+    :param samples: выборка
+    :param x_grid: точки, в которых нужна плотность
+    :param n_bins: число узлов сетки
+    :return: значения плотности в x_grid
     """
-    plt.figure(figsize=(12, 8))
+    samples = np.asarray(samples, dtype=float)
+    x_grid = np.asarray(x_grid, dtype=float)
+    n = len(samples)
+    bandwidth = samples.std(ddof=1) * n ** (-1 / 5) if n > 1 else 0.0
+    if not bandwidth > 0:
+        return np.zeros_like(x_grid)
 
-    colors = ["skyblue", "orange", "green", "red", "purple"]
+    # сетка с запасом в 5 ширин ядра: хвосты ядра крайних наблюдений не обрезаются
+    lo = min(samples.min(), x_grid.min()) - 5 * bandwidth
+    hi = max(samples.max(), x_grid.max()) + 5 * bandwidth
+    n_bins = max(n_bins, min(int(4 * (hi - lo) / bandwidth) + 1, 2**16))
+    delta = (hi - lo) / (n_bins - 1)
 
-    x_grid = np.linspace(xlim[0], xlim[1], 1000)
+    position = (samples - lo) / delta
+    left = np.minimum(position.astype(np.intp), n_bins - 2)
+    weight = position - left
+    counts = np.bincount(left, 1 - weight, minlength=n_bins) + np.bincount(left + 1, weight, minlength=n_bins)
+
+    half = int(np.ceil(5 * bandwidth / delta))
+    offsets = np.arange(-half, half + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = fftconvolve(counts, kernel, mode="same") / n
+    return np.interp(x_grid, lo + np.arange(n_bins) * delta, np.maximum(density, 0))
 
-    for i, durations in enumerate(durations_list):
-        color = colors[i % len(colors)]
+def empirical_cdf(durations, max_points=CDF_POINTS):
+    """
+    Точки эмпирической функции распределения. Выборка до max_points сортируется целиком,
+    большая — раскладывается по max_points корзинам (накопленная гистограмма)
+
+    :return: (x, F(x))
+    """
+    durations = np.asarray(durations, dtype=float)
+    n = len(durations)
+    if n <= max_points:
+        return np.sort(durations), np.arange(1, n + 1) / n
+    counts, edges = np.histogram(durations, bins=max_points)
+    return edges[1:], np.cumsum(counts) / n
+
+def pdf_job(durations_list, labels, filename, bins=40, xlim=(40, 80)):
+    """Задание на график плотности для render_percentile_plots (параметры — как у plot_percentile_pdf)"""
+    return {"kind": "pdf", "durations_list": durations_list, "labels": labels,
+            "filename": filename, "bins": bins, "xlim": xlim}
+
+def cdf_job(durations_list, labels, filename, xlim=None):
+    """Задание на график CDF для render_percentile_plots (параметры — как у plot_percentile_cdfs)"""
+    return {"kind": "cdf", "durations_list": durations_list, "labels": labels,
+            "filename": filename, "xlim": xlim}
+
+def job_digest(job):
+    """Хэш входных данных и параметров графика: по нему пропускаются неизменившиеся PNG"""
+    h = hashlib.sha256()
+    params = {key: value for key, value in job.items() if key not in ("durations_list", "filename")}
+    h.update(f"v{PLOT_VERSION}|{sorted((key, repr(value)) for key, value in params.items())}".encode("utf-8"))
+    for durations in job["durations_list"]:
+        array = np.ascontiguousarray(durations, dtype=float)
+        h.update(str(array.shape).encode("ascii"))
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+def _saved_digest(filename):
+    try:
+        # текстовые блоки записываются перед данными изображения: хватает чтения заголовка
+        with Image.open(filename) as image:
+            return image.info.get(DIGEST_KEY)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def is_up_to_date(job, digest=None):
+    """Файл графика уже нарисован по тем же данным"""
+    return _saved_digest(job["filename"]) == (digest or job_digest(job))
+
+def _template(kind):
+    """
+    Фигура и оси графика вида kind, общие для всех графиков процесса:
+    подписи, заголовок и сетка создаются один раз, а между графиками
+    заменяются только гистограммы, кривые и легенда
+    """
+    if kind not in _templates:
+        figure = Figure(figsize=(12, 8))
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+        ax.set_xlabel("Длительность проекта (дни)")
+        if kind == "pdf":
+            ax.set_ylabel("Плотность вероятности")
+            ax.set_title("Распределение длительности проекта (разные процентили задач)")
+        else:
+            ax.set_ylabel("Накопленная вероятность (CDF)")
+            ax.set_title("CDF длительности проекта (разные процентили задач)")
+        ax.grid(True, linestyle="--", alpha=0.7)
+        _templates[kind] = {"figure": figure, "ax": ax, "artists": [], "layout": False}
+    return _templates[kind]
+
+def _histogram_collection(durations, bins, xlim, color, label):
+    """Гистограмма плотности одним набором прямоугольников вместо отдельного Patch на каждую корзину"""
+    heights, edges = np.histogram(durations, bins=bins, range=xlim, density=True)
+    verts = np.empty((len(heights), 4, 2))
+    verts[:, 0, 0] = verts[:, 1, 0] = edges[:-1]
+    verts[:, 2, 0] = verts[:, 3, 0] = edges[1:]
+    verts[:, 0, 1] = verts[:, 3, 1] = 0
+    verts[:, 1, 1] = verts[:, 2, 1] = heights
+    collection = PolyCollection(verts, facecolors=color, edgecolors="black", alpha=0.4, label=label)
+    collection.sticky_edges.y.append(0)
+    return collection
+
+def _draw_pdf(ax, job):
+    xlim = job["xlim"]
+    x_grid = np.linspace(xlim[0], xlim[1], 1000)
+    lines, hists = [], []
+    for i, durations in enumerate(job["durations_list"]):
+        color = COLORS[i % len(COLORS)]
+        label = job["labels"][i]
 
         # гистограмма
-        plt.hist(
-            durations, bins=bins, range=xlim, density=True,
-            alpha=0.4, color=color, edgecolor="black", label=f"{labels[i]} (гист.)"
-        )
+        collection = _histogram_collection(durations, job["bins"], xlim, color, f"{label} (гист.)")
+        ax.add_collection(collection, autolim=False)
+        hists.append(collection)
 
         # KDE
-        kde = gaussian_kde(durations)
-        line, = plt.plot(x_grid, kde(x_grid), color=color, linewidth=2.5, label=labels[i])
+        line, = ax.plot(x_grid, binned_kde(durations, x_grid), color=color, linewidth=2.5, label=label)
         line.set_path_effects([pe.Stroke(linewidth=4, foreground="black"), pe.Normal()])
+        lines.append(line)
+    return lines + hists
 
-    plt.xlabel("Длительность проекта (дни)")
-    plt.ylabel("Плотность вероятности")
-    plt.title("Распределение длительности проекта (разные процентили задач)")
-    plt.legend()
-    plt.grid(True, linestyle="--", alpha=0.7)
-    plt.tight_layout()
-    
-    plt.savefig(filename, dpi=300)
-    plt.close()
+def _draw_cdf(ax, job):
+    lines = []
+    for i, durations in enumerate(job["durations_list"]):
+        x, cdf_vals = empirical_cdf(durations)
+        line, = ax.plot(x, cdf_vals, color=COLORS[i % len(COLORS)], linewidth=2.5, label=job["labels"][i])
+        lines.append(line)
+    return lines
 
+def _render(job, digest=None):
+    """Рисует один график на заготовке своего вида и сохраняет его с хэшем данных в метаданных"""
+    template = _template(job["kind"])
+    figure, ax = template["figure"], template["ax"]
+    for artist in template["artists"]:
+        artist.remove()
 
-def plot_percentile_cdfs(durations_list, labels, filename, xlim=None):
+    handles = _draw_pdf(ax, job) if job["kind"] == "pdf" else _draw_cdf(ax, job)
+    legend = ax.legend(handles=handles)
+    template["artists"] = handles + [legend]
+
+    # relim не учитывает наборы прямоугольников: их границы добавляются отдельно
+    ax.relim()
+    for artist in handles:
+        if isinstance(artist, PolyCollection):
+            ax.update_datalim(artist.get_datalim(ax.transData).get_points())
+    ax.set_autoscale_on(True)
+    ax.autoscale_view()
+    if job["kind"] == "cdf" and job["xlim"]:
+        ax.set_xlim(job["xlim"])
+
+    # поля вокруг осей подбираются по первому графику и дальше не пересчитываются:
+    # tight_layout требует отдельной отрисовки всей фигуры
+    if not template["layout"]:
+        figure.tight_layout()
+        template["layout"] = True
+
+    figure.savefig(job["filename"], dpi=300, metadata={DIGEST_KEY: digest or job_digest(job)},
+                   pil_kwargs={"compress_level": PNG_COMPRESS_LEVEL})
+    return job["filename"]
+
+def _render_jobs(jobs):
+    """Выполняется в процессе пула: графики рисуются подряд на одних и тех же заготовках"""
+    return [_render(job, digest) for job, digest in jobs]
+
+@profiled("plot.percentile_batch")
+def render_percentile_plots(jobs, pool=None, max_workers=None, force=False):
     """
-    Рисует CDF (накопленные распределения) для нескольких наборов данных.
+    Рисует пачку графиков PDF/CDF (задания — pdf_job и cdf_job).
+
+    Графики, PNG которых уже нарисован по тем же данным (хэш в метаданных файла),
+    пропускаются. Остальные делятся между процессами пула; каждый процесс рисует
+    свою часть на одной заготовке фигуры.
+
+    :param jobs: список заданий
+    :param pool: SimulationPool; без него создаётся временный пул, если процессоров больше одного
+    :param max_workers: число процессов временного пула
+    :param force: перерисовать все графики
+    :return: список файлов, которые были нарисованы
+    """
+    todo = []
+    for job in jobs:
+        digest = job_digest(job)
+        if force or not is_up_to_date(job, digest):
+            todo.append((job, digest))
+
+    workers = pool.max_workers if pool is not None else (max_workers or os.cpu_count() or 1)
+    workers = min(workers, len(todo))
+    if workers <= 1:
+        return _render_jobs(todo)
+
+    with using_pool(pool, workers) as pool:
+        # графики одного вида идут подряд, чтобы каждый процесс переиспользовал заготовку
+        todo.sort(key=lambda item: item[0]["kind"])
+        parts = [pool.submit(_render_jobs, todo[k::workers]) for k in range(workers)]
+        return [filename for part in parts for filename in part.result()]
+
+@profiled("plot.percentile_pdf")
+def plot_percentile_pdf(durations_list, labels, filename, bins=40, xlim=(40, 80), force=False):
+    """
+    Рисует распределения длительности проекта для нескольких наборов данных:
+    - гистограмма (фон)
+    - KDE-кривая поверх неё
 
     :param durations_list: список массивов с длительностями (например, [dur1, dur2, dur3])
     :param labels: список подписей (например, ["p=50%", "p=70%", "p=90%"])
     :param filename: путь для сохранения графика
-    :param xlim: диапазон по оси X (tuple или None)
+    :param bins: количество корзин гистограммы
+    :param xlim: диапазон по оси X (tuple)
+    :param force: перерисовать график, даже если данные не изменились
     """
-    plt.figure(figsize=(12, 8))
-
-    colors = ["skyblue", "orange", "green", "red", "purple"]
-
-    for i, durations in enumerate(durations_list):
-        durations = np.sort(durations)
-        n = len(durations)
-        cdf_vals = np.arange(1, n + 1) / n
-        color = colors[i % len(colors)]
-        plt.plot(durations, cdf_vals, color=color, linewidth=2.5, label=labels[i])
+    job = pdf_job(durations_list, labels, filename, bins, xlim)
+    digest = job_digest(job)
+    if force or not is_up_to_date(job, digest):
+        _render(job, digest)
 
-    if xlim:
-        plt.xlim(xlim)
 
-    plt.xlabel("Длительность проекта (дни)")
-    plt.ylabel("Накопленная вероятность (CDF)")
-    plt.title("CDF длительности проекта (разные процентили задач)")
-    plt.legend()
-    plt.grid(True, linestyle="--", alpha=0.7)
-    plt.tight_layout()
+@profiled("plot.percentile_cdfs")
+def plot_percentile_cdfs(durations_list, labels, filename, xlim=None, force=False):
+    """
+    Рисует CDF (накопленные распределения) для нескольких наборов данных.
 
-    plt.savefig(filename, dpi=300)
-    plt.close()
\ No newline at end of file
+    :param durations_list: список массивов с длительностями (например, [dur1, dur2, dur3])
+    :param labels: список подписей (например, ["p=50%", "p=70%", "p=90%"])
+    :param filename: путь для сохранения графика
+    :param xlim: диапазон по оси X (tuple или None)
+    :param force: перерисовать график, даже если данные не изменились
+    """
+    job = cdf_job(durations_list, labels, filename, xlim)
+    digest = job_digest(job)
+    if force or not is_up_to_date(job, digest):
+        _render(job, digest)